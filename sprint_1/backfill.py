@@ -0,0 +1,222 @@
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import transformation2
+
+# Backfill runner for local branch files: shards the input across a process pool,
+# each worker transforms its shard on its own, then one merge step decides the
+# product and branch ids for everything before loading.
+#
+#   python backfill.py                                   # the three sample files
+#   python backfill.py data/*.csv --workers 8 --load
+#   python backfill.py big.csv --chunk-mb 64 --load      # split one big file into byte ranges
+#   python backfill.py data/*.csv --engine columnar --load
+#
+# Byte range shards assume no newlines inside quoted fields, which holds for the branch files.
+#
+# --engine columnar transforms each file with columnar_transformation (pandas, see
+# requirements-backfill.txt) into the tables the Lambda would make for it, deterministic ids included,
+# so files already loaded by the Lambda or an earlier backfill are skipped by ON CONFLICT DO NOTHING.
+# Identical rows are numbered per file, so it shards by whole files only (no --chunk-mb).
+
+# Order lines turned into records and inserted per chunk, so only a chunk's worth of tuples is alive at once
+COLUMNAR_LOAD_CHUNK_ROWS = 100_000
+
+
+# Split the files into (path, start, end) byte ranges of at most chunk_bytes (0 = whole files)
+def plan_shards(paths, chunk_bytes=0):
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if chunk_bytes <= 0 or size <= chunk_bytes:
+            shards.append((path, 0, size))
+            continue
+        for start in range(0, size, chunk_bytes):
+            shards.append((path, start, min(start + chunk_bytes, size)))
+    return shards
+
+
+# Rows whose line starts inside [start, end). A line that straddles start belongs to the shard before.
+def read_shard(path, start, end):
+    lines = []
+    with open(path, mode='rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            lines.append(line.decode('utf-8'))
+    return [row for row in csv.reader(lines) if row]
+
+
+# Runs in a worker process. Ids aren't known yet, so the natural keys stand in for them:
+# the product key tuple as product_id and the branch name as branch_id.
+def transform_shard(shard):
+    path, start, end = shard
+    rows = read_shard(path, start, end)
+    removed_pii = transformation2.remove_sensitive_info(rows)
+    parsed_products = transformation2.parse_products(removed_pii)
+
+    products = {}
+    for p in parsed_products:
+        products.setdefault((p['name'], p['size'], p['flavour']), p['price'])
+    branch_names = list(dict.fromkeys(row[1] for row in removed_pii[1:]))
+
+    products_table = [{"name": key[0], "size": key[1], "flavour": key[2], "product_id": key} for key in products]
+    branches_table = [{"branch_name": name, "branch_id": name} for name in branch_names]
+    orders = transformation2.normalize_orders(removed_pii, products_table, branches_table)
+
+    print(f'Transformed {path} bytes {start}-{end}: rows={len(rows)}, orders={len(orders)}')
+    return products, branch_names, orders
+
+
+# One id per product key and branch name across all shards: ids already in the DB are
+# reused, new ones are handed out here in sorted key order, so the result doesn't depend
+# on which worker finished first.
+def merge_shards(shard_results, existing_products=None, existing_branches=None):
+    product_ids = dict(existing_products or {})
+    branch_ids = dict(existing_branches or {})
+
+    all_products = {}
+    all_branches = set()
+    for products, branch_names, _ in shard_results:
+        for key, price in products.items():
+            all_products.setdefault(key, price)
+        all_branches.update(branch_names)
+
+    clean_products_table = []
+    for key in sorted(all_products, key=lambda k: tuple('' if v is None else v for v in k)):
+        if key in product_ids:
+            continue
+        product_ids[key] = transformation2.generate_uuid()
+        name, size, flavour = key
+        clean_products_table.append({"size": size, "name": name, "flavour": flavour,
+                                     "price": all_products[key], "product_id": product_ids[key]})
+
+    clean_branch_table = []
+    for branch_name in sorted(all_branches):
+        if branch_name in branch_ids:
+            continue
+        branch_ids[branch_name] = transformation2.generate_uuid()
+        clean_branch_table.append({"branch_id": branch_ids[branch_name], "branch_name": branch_name})
+
+    clean_orders_table = []
+    for _, _, orders in shard_results:
+        for order in orders:
+            clean_orders_table.append({**order,
+                                       "product_id": product_ids[order["product_id"]],
+                                       "branch_id": branch_ids[order["branch_id"]]})
+
+    return clean_products_table, clean_branch_table, clean_orders_table
+
+
+# Runs in a worker process: one whole file -> its products, branches and orders as typed columns
+def transform_file_columnar(path):
+    import columnar_transformation
+
+    rows = read_shard(path, 0, os.path.getsize(path))
+    tables = columnar_transformation.transform_columns(rows)
+    print(f'Transformed {path} (columnar): rows={len(rows)}, orders={len(tables["orders"])}')
+    return tables
+
+
+# Same steps as run_backfill, with the Lambda's ids and loader: existing ids are reused by
+# natural key, then the three tables and their orders go in as one transaction
+def run_backfill_columnar(paths, workers=None, load=False):
+    import columnar_transformation
+
+    print(f'\nBackfill (columnar): {len(paths)} files on {workers or os.cpu_count()} workers\n')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tables = columnar_transformation.concat_tables(list(executor.map(transform_file_columnar, paths)))
+
+    if not load:
+        print(f'\nDry run: products={len(tables["products"])}, branches={len(tables["branches"])}, '
+              f'orders={len(tables["orders"])}\n')
+        return tables
+
+    from utils import sql_utils as lambda_sql_utils
+    from sql_utils import setup_db_connection
+
+    transformation = columnar_transformation.transformation
+    record_types = {"products": transformation.ProductRow, "branches": transformation.BranchRow,
+                    "orders": transformation.OrderRow}
+    conn, cursor = setup_db_connection()
+    try:
+        tables = columnar_transformation.reuse_existing_ids(tables,
+                                                            transformation.get_existing_products(cursor),
+                                                            transformation.get_existing_branches(cursor))
+        for table, record_type in record_types.items():
+            for start in range(0, len(tables[table]), COLUMNAR_LOAD_CHUNK_ROWS):
+                records = columnar_transformation.table_records(
+                    tables[table].iloc[start:start + COLUMNAR_LOAD_CHUNK_ROWS], record_type)
+                lambda_sql_utils.save_data_in_db(conn, cursor, table=table, data=records,
+                                                 columns=list(record_type._fields), mode='batch', commit=False)
+        conn.commit()
+        print(f'\nLoaded products={len(tables["products"])}, branches={len(tables["branches"])}, '
+              f'orders={len(tables["orders"])}\n')
+    finally:
+        cursor.close()
+        conn.close()
+    return tables
+
+
+def run_backfill(paths, workers=None, chunk_bytes=0, load=False, engine='legacy'):
+    if engine == 'columnar':
+        if chunk_bytes > 0:
+            raise ValueError('the columnar engine numbers identical rows per file, it can only shard whole files')
+        return run_backfill_columnar(paths, workers=workers, load=load)
+
+    shards = plan_shards(paths, chunk_bytes)
+    print(f'\nBackfill: {len(paths)} files in {len(shards)} shards on {workers or os.cpu_count()} workers\n')
+
+    # map keeps shard order, whatever order the workers finish in
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shard_results = list(executor.map(transform_shard, shards))
+
+    if not load:
+        products, branches, orders = merge_shards(shard_results)
+        print(f'\nDry run: products={len(products)}, branches={len(branches)}, orders={len(orders)}\n')
+        return products, branches, orders
+
+    import load2
+    from sql_utils import setup_db_connection
+
+    conn, cursor = setup_db_connection()
+    try:
+        products, branches, orders = merge_shards(shard_results,
+                                                  transformation2.get_existing_products(cursor),
+                                                  transformation2.get_existing_branches(cursor))
+        load2.insert_products(products, cursor, conn)
+        load2.insert_branches(branches, cursor, conn)
+        load2.insert_orders(orders, cursor, conn)
+        print(f'\nLoaded products={len(products)}, branches={len(branches)}, orders={len(orders)}\n')
+    finally:
+        cursor.close()
+        conn.close()
+    return products, branches, orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Transform branch CSV files in parallel and load them')
+    parser.add_argument('files', nargs='*', default=transformation2.datas, help='branch CSV files')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--chunk-mb', type=float, default=0,
+                        help='split files bigger than this into byte ranges of this size (default: whole files)')
+    parser.add_argument('--load', action='store_true', help='load into the local database (default: dry run)')
+    parser.add_argument('--engine', choices=['legacy', 'columnar'], default='legacy',
+                        help='legacy: transformation2 with new uuid4 ids; columnar: the Lambda\'s tables and ids, '
+                             'built with pandas (default: legacy)')
+    args = parser.parse_args()
+    if args.engine == 'columnar' and args.chunk_mb:
+        parser.error('--chunk-mb splits files, the columnar engine needs whole files')
+
+    run_backfill(args.files, workers=args.workers, chunk_bytes=int(args.chunk_mb * 1024 * 1024), load=args.load,
+                 engine=args.engine)
+
+
+if __name__ == "__main__":
+    main()
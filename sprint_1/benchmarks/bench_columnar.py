@@ -0,0 +1,72 @@
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+# Compare the row engine the Lambda uses (transformation.transform_rows) with the columnar engine
+# backfill.py --engine columnar uses, on synthetic branch files read the way the backfill reads them.
+# Run from sprint_1/: python benchmarks/bench_columnar.py --rows 1000000 --branches 500
+# Many branch files over the same few days is what a backfill looks like: dates repeat across
+# files, baskets repeat a lot. "columnar" stops at the typed tables, "+records" also builds
+# the records transform_rows returns.
+
+SPRINT_1 = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SPRINT_1)
+sys.path.insert(1, os.path.join(SPRINT_1, '..', 'sprint_2', 'benchmarks'))
+
+import columnar_transformation  # noqa: E402
+from columnar_transformation import transformation  # noqa: E402
+from generate_branch_files import write_branch_files  # noqa: E402
+
+
+# Every file's rows after a file marker, as the workers' tables put together are numbered
+def read_files(paths):
+    rows = []
+    for path in paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            rows.append(transformation.SourceStart(path))
+            rows.extend(row for row in csv.reader(f) if row)
+    return rows
+
+
+# CPU seconds of the fastest of `rounds` runs, each from cold parse caches
+def best_time(func, rows, rounds):
+    best = None
+    for _ in range(rounds):
+        transformation.parse_product_item.cache_clear()
+        transformation.parse_order_datetime.cache_clear()
+        start = time.process_time()
+        result = func(rows)
+        seconds = time.process_time() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Row vs columnar transformation of branch files')
+    parser.add_argument('--rows', type=int, default=100_000, help='rows across all files (default: 100000)')
+    parser.add_argument('--branches', type=int, default=50, help='branch count, one file each (default: 50)')
+    parser.add_argument('--menu-size', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rounds', type=int, default=3, help='best of N rounds (default: 3)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rows = read_files(write_branch_files(tmp_dir, args.rows, args.menu_size, args.branches, args.seed))
+
+    row_seconds, expected = best_time(transformation.transform_rows, rows, args.rounds)
+    columnar_seconds, tables = best_time(columnar_transformation.transform_columns, rows, args.rounds)
+    records_seconds, records = best_time(
+        lambda r: columnar_transformation.to_records(columnar_transformation.transform_columns(r)), rows, args.rounds)
+    assert records == expected, 'the columnar engine changed the tables'
+
+    print(f'rows={args.rows} files={args.branches} order_lines={len(tables["orders"])}')
+    print(f'{"engine":<18} {"cpu":>9} {"speedup":>8}')
+    for name, seconds in (('rows', row_seconds), ('columnar', columnar_seconds), ('columnar+records', records_seconds)):
+        print(f'{name:<18} {seconds:>8.2f}s {row_seconds / seconds:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# Compare the set based dedup in transformation.py with the list based version it replaced.
+# Run from sprint_1/: python benchmarks/bench_dedup.py --sizes 10000 100000 1000000 --unique 1000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transformation  # noqa: E402
+
+
+# The previous implementations, kept here as the baseline
+def list_drop_duplicate_product_values(list_of_dict):
+    seen_product = []
+    unique_rows = []
+    for dict in list_of_dict:
+        keys = (dict['size'] if dict["size"] else None,
+                dict['name'],
+                dict['flavour'] if dict["flavour"] else None,
+                dict['price'])
+        if keys not in seen_product:
+            seen_product.append(keys)
+            unique_rows.append(dict)
+    return unique_rows
+
+
+def list_drop_duplicate_branches(list_of_dict):
+    seen_product = []
+    unique_rows = []
+    for dict in list_of_dict:
+        if (dict['branch_name']) not in seen_product:
+            seen_product.append(dict['branch_name'])
+            unique_rows.append(dict)
+    return unique_rows
+
+
+def make_products(count, unique, rng):
+    menu = [{"size": rng.choice(["Regular", "Large", None]), "name": f"Drink {i}",
+             "flavour": rng.choice([None, "Hazelnut", "Vanilla"]), "price": round(1 + i * 0.05, 2)}
+            for i in range(unique)]
+    return [dict(rng.choice(menu)) for _ in range(count)]
+
+
+def make_branches(count, unique, rng):
+    return [{"branch_id": str(i), "branch_name": f"Branch {rng.randrange(unique)}"} for i in range(count)]
+
+
+def time_once(func, items):
+    start = time.perf_counter()
+    result = func(items)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List vs set dedup of products and branches')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--unique', type=int, default=1000, help='distinct products / branches in the input')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f'{"items":>10} {"table":<9} {"list":>10} {"set":>10} {"speedup":>8}')
+    for size in args.sizes:
+        cases = (
+            ('products', make_products(size, args.unique, rng),
+             list_drop_duplicate_product_values, transformation.drop_duplicate_product_values),
+            ('branches', make_branches(size, args.unique, rng),
+             list_drop_duplicate_branches, transformation.drop_duplicate_branches),
+        )
+        for table, items, old_func, new_func in cases:
+            old_seconds, expected = time_once(old_func, items)
+            new_seconds, result = time_once(new_func, items)
+            assert result == expected, f'{table}: set dedup changed the output'
+            print(f'{size:>10} {table:<9} {old_seconds:>9.3f}s {new_seconds:>9.3f}s {old_seconds / new_seconds:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
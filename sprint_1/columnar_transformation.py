@@ -0,0 +1,234 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# The Lambda's transformation module (sprint_2/src) supplies the parsers, the deterministic ids and
+# the ProductRow / BranchRow / OrderRow records, so both engines give every product, branch and
+# order the same id. sprint_1 has a transformation.py of its own, so sprint_2/src goes first.
+SPRINT_2_SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sprint_2', 'src')
+sys.path.insert(0, SPRINT_2_SRC)
+
+import transformation  # noqa: E402
+
+if not hasattr(transformation, 'RowTransformer'):
+    raise ImportError(f'columnar_transformation needs the transformation module in {SPRINT_2_SRC}, '
+                      f'but {transformation.__file__} was imported first')
+
+# Columnar engine for large backfills (backfill.py --engine columnar): the products, branches and
+# orders of transformation.transform_rows, built column by column with pandas/numpy.
+# Anything that only depends on a value (stripping and exploding a basket, parsing an item or a
+# date, resolving an id) is done once per distinct value after a factorize; the per-row work
+# (which lines an order gets, numbering identical orders) is integer array indexing and groupby.
+# The tables come back as typed columns (quantity int64, order_date datetime64, total_price float64),
+# so no Python object is built per order line until to_records() is asked for them.
+# pandas/numpy are only needed here (requirements-backfill.txt), the Lambda bundle doesn't ship this.
+
+# Branch file columns the transform reads: column 2 (customer name) and 6 (card number) never are
+COLUMNS = ['datetime', 'branch', 'basket', 'total_price', 'payment_method']
+
+
+# Strings and None as they are. Without dtype=object pandas infers its string dtype and None becomes NaN.
+def _objects(values):
+    return pd.Series(values, dtype=object)
+
+
+def _table(record_type, columns):
+    return pd.DataFrame(dict(zip(record_type._fields, columns)))
+
+
+# Raw rows (a list, an extract.extract_stream iterator, or transformation.rows_by_source over several
+# files) -> one column per field plus the index of the source file each row came from.
+# Rows shorter than a branch file row are skipped, as transform_rows skips them.
+# The fields go straight into one list per column: lists of strings are all the garbage collector
+# has to track, where a tuple per row would be millions of objects for it to scan.
+def load_columns(rows):
+    datetimes, branches, baskets, totals, payments = columns = [], [], [], [], []
+    source_starts = []
+    for row in rows:
+        if len(row) < 6:
+            if row.__class__ is transformation.SourceStart:
+                source_starts.append(len(datetimes))
+            continue
+        datetimes.append(row[0])
+        branches.append(row[1])
+        baskets.append(row[3])
+        totals.append(row[4])
+        payments.append(row[5])
+
+    # Rows before the first marker (or all of them, with no markers) count as one source
+    if not source_starts or source_starts[0] != 0:
+        source_starts.insert(0, 0)
+    source_sizes = np.diff(np.append(source_starts, len(datetimes)))
+
+    frame = pd.DataFrame({name: _objects(values) for name, values in zip(COLUMNS, columns)})
+    frame['source'] = np.repeat(np.arange(len(source_sizes)), source_sizes)
+    return frame
+
+
+# Ids for the distinct keys, in first-seen order: ids already known (snapshot or a cache lookup)
+# are reused, the other keys get new_id(key) and a record from new_record(id, key)
+def _resolve_ids(keys, cache, cursor, new_id, new_record):
+    known = cache.snapshot() if cache is not None else {}
+    ids = []
+    records = []
+    for key in keys:
+        key_id = known.get(key)
+        if key_id is None and cache is not None:
+            key_id = cache.get(key, cursor)
+        if key_id is None:
+            key_id = new_id(key)
+            records.append(new_record(key_id, key))
+        known[key] = key_id
+        ids.append(key_id)
+    return np.array(ids, dtype=object), records
+
+
+# For groups with counts[i] lines starting at starts[i]: the group and the line of every line, in order
+def _expand(starts, counts):
+    owners = np.repeat(np.arange(len(counts)), counts)
+    first_line = np.cumsum(counts) - counts
+    return owners, starts[owners] + np.arange(owners.size) - first_line[owners]
+
+
+def transform_frame(frame, cursor=None):
+    product_cache = transformation.PRODUCT_ID_CACHE.begin(cursor) if cursor is not None else None
+    branch_cache = transformation.BRANCH_ID_CACHE.begin(cursor) if cursor is not None else None
+
+    # Every row names a branch, even one without a basket or a valid date
+    branch_codes, branch_names = pd.factorize(frame['branch'].to_numpy())
+    branch_ids, branch_records = _resolve_ids(
+        branch_names.tolist(), branch_cache, cursor, transformation.branch_uuid, transformation.BranchRow)
+
+    # Distinct values come in first-seen order, so the products found in the distinct baskets do
+    # too, each with the price of the first item that named it
+    raw_basket_codes, raw_baskets = pd.factorize(frame['basket'].to_numpy())
+    stripped_codes, baskets = pd.factorize(np.array([basket.strip() for basket in raw_baskets], dtype=object))
+    basket_codes = stripped_codes[raw_basket_codes]
+    # An empty basket explodes to '', which doesn't parse
+    basket_items = _objects(baskets).str.split(',').explode()
+
+    item_codes, distinct_items = pd.factorize(basket_items.to_numpy())
+    product_keys = {}
+    item_product = np.full(len(distinct_items), -1, dtype=np.int64)
+    item_price = np.zeros(len(distinct_items), dtype=np.float64)
+    for code, item in enumerate(distinct_items):
+        parsed = transformation.parse_product_item(item)
+        if parsed is None:
+            continue
+        size, name, flavour, price = parsed
+        item_product[code] = product_keys.setdefault((name, size, flavour), (len(product_keys), price))[0]
+        item_price[code] = price
+
+    product_ids, product_records = _resolve_ids(
+        product_keys, product_cache, cursor, transformation.product_uuid,
+        lambda product_id, key: transformation.ProductRow(product_id, *key, product_keys[key][1]))
+
+    # A basket's order lines: its parsed items counted per product, in the order the products
+    # first appear in it, at the last price it gave them
+    parsed_items = item_product[item_codes] >= 0
+    lines = pd.DataFrame({'basket': basket_items.index.to_numpy()[parsed_items],
+                          'product': item_product[item_codes][parsed_items],
+                          'price': item_price[item_codes][parsed_items]})
+    lines = lines.groupby(['basket', 'product'], sort=False).agg(quantity=('price', 'size'), price=('price', 'last'))
+    line_basket = lines.index.get_level_values('basket').to_numpy()
+    line_product = lines.index.get_level_values('product').to_numpy()
+    line_quantity = lines['quantity'].to_numpy()
+    line_total = lines['price'].to_numpy() * line_quantity
+    basket_line_counts = np.bincount(line_basket, minlength=len(baskets))
+    basket_line_starts = np.cumsum(basket_line_counts) - basket_line_counts
+
+    # A row is an order if it has a basket and a valid date, whether or not any of its items parsed
+    date_codes, distinct_dates = pd.factorize(frame['datetime'].to_numpy())
+    order_dates = []
+    for datetime_str in distinct_dates:
+        try:
+            order_dates.append(transformation.parse_order_datetime(datetime_str) if datetime_str else None)
+        except ValueError:
+            order_dates.append(None)
+    order_dates = np.array(order_dates, dtype='datetime64[us]')
+    order_rows = np.flatnonzero((baskets != '')[basket_codes] & ~np.isnat(order_dates)[date_codes])
+
+    # Identical rows within a source file are numbered 0, 1, ... (transformation.OrderIds)
+    total_codes, totals = pd.factorize(frame['total_price'].to_numpy())
+    payment_codes, payments = pd.factorize(frame['payment_method'].to_numpy())
+    order_codes = pd.DataFrame({'source': frame['source'].to_numpy(), 'branch': branch_codes, 'date': date_codes,
+                                'basket': basket_codes, 'total': total_codes, 'payment': payment_codes}).iloc[order_rows]
+    occurrences = order_codes.groupby(list(order_codes.columns), sort=False).cumcount().tolist()
+    order_fields = zip(branch_names[order_codes['branch']].tolist(), distinct_dates[order_codes['date']].tolist(),
+                       baskets[order_codes['basket']].tolist(), totals[order_codes['total']].tolist(),
+                       payments[order_codes['payment']].tolist())
+    order_ids = np.array(list(map(transformation.order_uuid, order_fields, occurrences)), dtype=object)
+
+    # Every order row takes the lines of its basket
+    order_baskets = basket_codes[order_rows]
+    line_order, line = _expand(basket_line_starts[order_baskets], basket_line_counts[order_baskets])
+    line_row = order_rows[line_order]
+
+    return {
+        "products": _table(transformation.ProductRow, map(_objects, zip(*product_records))
+                           if product_records else [_objects([])] * 5),
+        "branches": _table(transformation.BranchRow, map(_objects, zip(*branch_records))
+                           if branch_records else [_objects([])] * 2),
+        "orders": _table(transformation.OrderRow, [
+            _objects(order_ids[line_order]),
+            _objects(branch_ids[branch_codes[line_row]]),
+            _objects(product_ids[line_product[line]]),
+            line_quantity[line],
+            order_dates[date_codes[line_row]],
+            line_total[line],
+            _objects(payments[payment_codes[line_row]]),
+        ]),
+    }
+
+
+# Drop-in for transformation.transform_rows, as typed columns (see to_records)
+def transform_columns(rows, cursor=None):
+    return transform_frame(load_columns(rows), cursor)
+
+
+# The tables of several files transformed on their own (backfill workers) as one set of tables.
+# Products and branches have content-derived ids, so the first copy of each is the one kept,
+# which gives the tables transform_frame returns for the files' rows chained with rows_by_source.
+def concat_tables(tables_list):
+    return {
+        "products": pd.concat([tables["products"] for tables in tables_list],
+                              ignore_index=True).drop_duplicates('product_id', ignore_index=True),
+        "branches": pd.concat([tables["branches"] for tables in tables_list],
+                              ignore_index=True).drop_duplicates('branch_id', ignore_index=True),
+        "orders": pd.concat([tables["orders"] for tables in tables_list], ignore_index=True),
+    }
+
+
+# Tables made without a cursor, pointed at the ids already in the database (e.g. older uuid4 rows):
+# products and branches found there are dropped and the orders use the existing ids instead.
+# existing_products / existing_branches as transformation.get_existing_products / get_existing_branches give them.
+def reuse_existing_ids(tables, existing_products, existing_branches):
+    products, branches, orders = tables["products"], tables["branches"], tables["orders"]
+    reused_products = {product_id: existing_products[key] for product_id, key in zip(
+        products['product_id'], zip(products['name'], products['size'], products['flavour']))
+        if key in existing_products}
+    reused_branches = {branch_id: existing_branches[name]
+                       for branch_id, name in zip(branches['branch_id'], branches['branch_name'])
+                       if name in existing_branches}
+    return {
+        "products": products[~products['product_id'].isin(list(reused_products))].reset_index(drop=True),
+        "branches": branches[~branches['branch_id'].isin(list(reused_branches))].reset_index(drop=True),
+        "orders": orders.assign(product_id=orders['product_id'].replace(reused_products),
+                                branch_id=orders['branch_id'].replace(reused_branches)),
+    }
+
+
+# The ProductRow / BranchRow / OrderRow records transform_rows gives for these rows.
+# tolist() turns the numpy values back into Python ones (int, float, datetime), which the driver can adapt.
+def table_records(table, record_type):
+    return list(map(record_type._make, zip(*(table[name].to_numpy().tolist() for name in record_type._fields))))
+
+
+def to_records(tables):
+    return {
+        "products": table_records(tables["products"], transformation.ProductRow),
+        "branches": table_records(tables["branches"], transformation.BranchRow),
+        "orders": table_records(tables["orders"], transformation.OrderRow),
+    }
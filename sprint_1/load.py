@@ -1,6 +1,5 @@
 from transformation import *
 from sql_utils import setup_db_connection
-from transformation import clean_products_table, clean_branch_table, clean_orders_table
 
 
 
@@ -66,9 +65,10 @@ def load_local():
         print("Database connection failed!")
         return
     
-    insert_products(clean_products_table, cursor, connection)
-    insert_branches(clean_branch_table, cursor, connection)
-    insert_orders(clean_orders_table, cursor, connection)
+    tables = run_local_etl()
+    insert_products(tables["clean_products_table"], cursor, connection)
+    insert_branches(tables["clean_branch_table"], cursor, connection)
+    insert_orders(tables["clean_orders_table"], cursor, connection)
 
     print("Loaded transformed data into local datatbase")
 
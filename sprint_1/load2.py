@@ -1,9 +1,9 @@
-from transformation2 import clean_products_table, clean_branch_table, clean_orders_table
+import transformation2
 from sql_utils import setup_db_connection
 
 def insert_products(products, cursor, connection):
     sql = """
-    INSERT INTO products (product_id, type, size, flavour, price)
+    INSERT INTO products (product_id, name, size, flavour, price)
     VALUES (%s, %s, %s, %s, %s)
     ON CONFLICT (product_id) DO NOTHING
     """
@@ -42,9 +42,9 @@ def insert_orders(orders, cursor, connection):
 
 def load_local():
     conn, cursor = setup_db_connection()
-    insert_products(clean_products_table, cursor, conn)
-    insert_branches(clean_branch_table, cursor, conn)
-    insert_orders(clean_orders_table, cursor, conn)
+    insert_products(transformation2.clean_products_table, cursor, conn)
+    insert_branches(transformation2.clean_branch_table, cursor, conn)
+    insert_orders(transformation2.clean_orders_table, cursor, conn)
     print("Loaded transformed data into local database")
 
     
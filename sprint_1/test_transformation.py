@@ -1,8 +1,9 @@
 import csv
 import pytest
+import unittest
 from unittest.mock import patch 
 import uuid
-from transformation import remove_sensitive_info, drop_duplicate_product_values, generate_uuid
+from transformation import remove_sensitive_info, drop_duplicate_product_values, drop_duplicate_branches, generate_uuid
 
 @pytest.fixture
 def raw_rows():
@@ -140,4 +141,30 @@ def test_will_drop_duplicate_keys():
 
     result = drop_duplicate_product_values(dummy_data)
 
-    assert result == expected, f'Expected {expected} but was {result}.'
\ No newline at end of file
+    assert result == expected, f'Expected {expected} but was {result}.'
+
+#edge case keeps the first occurrence of each key, in input order
+
+def test_drop_duplicates_keeps_first_occurrence_order():
+
+    # arrange
+
+    products = [{'size': 'Large', 'name': 'Latte', 'flavour': None, 'price': 2.45},
+                {'size': None, 'name': 'Speciality Tea', 'flavour': 'Peppermint', 'price': 1.30},
+                {'size': 'Large', 'name': 'Latte', 'flavour': None, 'price': 2.45},
+                {'size': 'Large', 'name': 'Latte', 'flavour': '', 'price': 2.45}]
+
+    branches = [{'branch_id': '1', 'branch_name': 'Leeds'},
+                {'branch_id': '2', 'branch_name': 'Chesterfield'},
+                {'branch_id': '3', 'branch_name': 'Leeds'}]
+
+    # act
+
+    unique_products = drop_duplicate_product_values(products)
+    unique_branches = drop_duplicate_branches(branches)
+
+    # assert
+
+    # an empty flavour is the same product as no flavour
+    assert unique_products == products[:2]
+    assert [b['branch_id'] for b in unique_branches] == ['1', '2']
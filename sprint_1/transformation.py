@@ -192,9 +192,11 @@ def convert_all_dates(list_of_dicts, date_cols,
 
     return list_of_dicts
 
+# seen_product is a set: membership is a hash lookup instead of a scan of every key seen so far
+# unique_rows keeps the first occurrence of each key, in input order
 def drop_duplicate_product_values(list_of_dict):
 
-    seen_product = []
+    seen_product = set()
 
     unique_rows = []
 
@@ -205,7 +207,7 @@ def drop_duplicate_product_values(list_of_dict):
                 dict['price'])
         
         if keys not in seen_product:
-            seen_product.append(keys)
+            seen_product.add(keys)
             unique_rows.append(dict)
         else:
             continue
@@ -229,13 +231,13 @@ def normalize_product_table(unique_rows):
 
 def drop_duplicate_branches(list_of_dict):
     
-    seen_product = []
+    seen_product = set()
 
     unique_rows = []
 
     for dict in list_of_dict:
         if (dict['branch_name']) not in seen_product:
-            seen_product.append(dict['branch_name'])
+            seen_product.add(dict['branch_name'])
             unique_rows.append(dict)
         else:
             continue
@@ -312,16 +314,47 @@ def normalise_orders(removed_pii, products_table, branch_table):
     return normalised_orders
 
 
-raw_data = extract_datas(datas)
-removed_pii = remove_sensitive_info(raw_data)
-parsed = parse_products(removed_pii)
-correctly_formatted_products = check_and_format_str_columns_correctly(parsed, cols_str_list=['size', 'name', 'flavour'])
-validated_float_cols = check_float_columns(correctly_formatted_products, float_cols=['price'])
-unique_rows_products = drop_duplicate_product_values(correctly_formatted_products)
-uncleaned_branch_table = normalize_branches(removed_pii)
-clean_products_table = normalize_product_table(unique_rows_products)
-clean_branch_table = drop_duplicate_branches(uncleaned_branch_table)
-
-clean_orders_table = normalise_orders(removed_pii, clean_products_table, clean_branch_table)
-
-
+# === Run the transformation locally ===
+def run_local_etl(datas=datas):
+    raw_data = extract_datas(datas)
+    removed_pii = remove_sensitive_info(raw_data)
+    parsed = parse_products(removed_pii)
+    correctly_formatted_products = check_and_format_str_columns_correctly(parsed, cols_str_list=['size', 'name', 'flavour'])
+    validated_float_cols = check_float_columns(correctly_formatted_products, float_cols=['price'])
+    unique_rows_products = drop_duplicate_product_values(correctly_formatted_products)
+    uncleaned_branch_table = normalize_branches(removed_pii)
+    clean_products_table = normalize_product_table(unique_rows_products)
+    clean_branch_table = drop_duplicate_branches(uncleaned_branch_table)
+
+    clean_orders_table = normalise_orders(removed_pii, clean_products_table, clean_branch_table)
+    return {
+        "raw_data": raw_data,
+        "removed_pii": removed_pii,
+        "parsed": parsed,
+        "correctly_formatted_products": correctly_formatted_products,
+        "validated_float_cols": validated_float_cols,
+        "unique_rows_products": unique_rows_products,
+        "uncleaned_branch_table": uncleaned_branch_table,
+        "clean_products_table": clean_products_table,
+        "clean_branch_table": clean_branch_table,
+        "clean_orders_table": clean_orders_table,
+    }
+
+_local_etl_results = None
+_local_etl_names = ("raw_data", "removed_pii", "parsed", "correctly_formatted_products", "validated_float_cols",
+                    "unique_rows_products", "uncleaned_branch_table", "clean_products_table", "clean_branch_table",
+                    "clean_orders_table")
+
+# Importing this module doesn't run the transformation (load.py and the tests import it).
+# The results are still available as module attributes, computed once on first access.
+def __getattr__(name):
+    global _local_etl_results
+    if name not in _local_etl_names:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _local_etl_results is None:
+        _local_etl_results = run_local_etl()
+    return _local_etl_results[name]
+
+
+if __name__ == "__main__":
+    run_local_etl()
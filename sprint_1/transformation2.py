@@ -72,7 +72,7 @@ def parse_products(rows):
 
 # Drop duplicates and reuse UUIDs from DB
 def get_existing_products(cursor):
-    cursor.execute("SELECT product_id, type, size, flavour FROM products")
+    cursor.execute("SELECT product_id, name, size, flavour FROM products")
     return { (row[1], row[2], row[3]): row[0] for row in cursor.fetchall() }
 
 def drop_duplicate_product_values(parsed_list, cursor):
@@ -152,7 +152,7 @@ def normalize_orders(rows, products_table, branches_table):
                 continue
 
             quantity_counter[product_id] += 1
-            product_prices[product_id] = (price)
+            product_prices[product_id] = float(price)
 
         order_id = generate_uuid()
         for product_id, qty in quantity_counter.items():
@@ -169,10 +169,28 @@ def normalize_orders(rows, products_table, branches_table):
     return normalised_orders
 
 # === Run ETL locally ===
-conn, cursor = setup_db_connection()
-raw_data = extract_datas(datas)
-removed_pii = remove_sensitive_info(raw_data)
-parsed_products = parse_products(removed_pii)
-clean_products_table = drop_duplicate_product_values(parsed_products, cursor)
-clean_branch_table = normalize_branches(removed_pii, cursor)
-clean_orders_table = normalize_orders(removed_pii, clean_products_table, clean_branch_table)
+def run_local_etl(datas=datas):
+    conn, cursor = setup_db_connection()
+    raw_data = extract_datas(datas)
+    removed_pii = remove_sensitive_info(raw_data)
+    parsed_products = parse_products(removed_pii)
+    clean_products_table = drop_duplicate_product_values(parsed_products, cursor)
+    clean_branch_table = normalize_branches(removed_pii, cursor)
+    clean_orders_table = normalize_orders(removed_pii, clean_products_table, clean_branch_table)
+    return {
+        "clean_products_table": clean_products_table,
+        "clean_branch_table": clean_branch_table,
+        "clean_orders_table": clean_orders_table,
+    }
+
+_local_etl_results = None
+
+# Importing this module no longer runs the ETL (backfill.py imports it in every worker).
+# The tables are still available as module attributes, computed on first access.
+def __getattr__(name):
+    global _local_etl_results
+    if name not in ("clean_products_table", "clean_branch_table", "clean_orders_table"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _local_etl_results is None:
+        _local_etl_results = run_local_etl()
+    return _local_etl_results[name]
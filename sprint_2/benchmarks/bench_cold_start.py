@@ -0,0 +1,63 @@
+# Cold start cost of the Lambda module: time to import cuppa_chaos_etl_lambda in a fresh interpreter,
+# the same work the Lambda runtime does in its init phase (before the first invocation).
+# Run from sprint_2/: python benchmarks/bench_cold_start.py --rounds 20 --top 15
+#
+# Reports the import time measured inside each fresh interpreter (interpreter start-up itself
+# not included), and the slowest imports (cumulative, from python -X importtime) of the last round.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+HANDLER_MODULE = 'cuppa_chaos_etl_lambda'
+
+TIMED_IMPORT = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "print((time.perf_counter() - start) * 1000)\n"
+)
+
+
+def time_import(module):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', TIMED_IMPORT.format(module=module)],
+                            cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip()), result.stderr
+
+
+# -X importtime lines: "import time: self [us] | cumulative | imported package"
+def slowest_imports(importtime_output, top):
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f'Import time of {HANDLER_MODULE} in a fresh interpreter')
+    parser.add_argument('--rounds', type=int, default=10, help='fresh interpreters to start (default: 10)')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list (default: 10)')
+    parser.add_argument('--module', default=HANDLER_MODULE, help=f'module to import (default: {HANDLER_MODULE})')
+    args = parser.parse_args()
+
+    timings = []
+    importtime_output = ''
+    for _ in range(args.rounds):
+        elapsed_ms, importtime_output = time_import(args.module)
+        timings.append(elapsed_ms)
+
+    print(f'import {args.module}: median={statistics.median(timings):.1f}ms '
+          f'min={min(timings):.1f}ms max={max(timings):.1f}ms rounds={args.rounds}')
+    print('\nSlowest imports (cumulative):')
+    for cumulative_us, name in slowest_imports(importtime_output, args.top):
+        print(f'{cumulative_us / 1000:>9.1f}ms {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Compare datetime.strptime against transformation.parse_order_datetime on order timestamps.
+# Run from sprint_2/: python benchmarks/bench_datetime.py --count 200000
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import transformation  # noqa: E402
+
+
+# One day of trading, a few orders per minute, like a real branch file
+def make_timestamps(count):
+    start = datetime(2023, 5, 9, 8, 0)
+    return [(start + timedelta(minutes=(i // 3) % 720)).strftime(transformation.ORDER_DATETIME_FORMAT)
+            for i in range(count)]
+
+
+def strptime_path(timestamps):
+    return [datetime.strptime(ts, transformation.ORDER_DATETIME_FORMAT) for ts in timestamps]
+
+
+def sliced_uncached(timestamps):
+    parse = transformation.parse_order_datetime.__wrapped__
+    return [parse(ts) for ts in timestamps]
+
+
+def sliced_cached(timestamps):
+    transformation.parse_order_datetime.cache_clear()
+    return [transformation.parse_order_datetime(ts) for ts in timestamps]
+
+
+def best_of(func, timestamps, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(timestamps)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='strptime vs sliced order timestamp parsing')
+    parser.add_argument('--count', type=int, default=200_000, help='number of timestamps to parse')
+    parser.add_argument('--rounds', type=int, default=3, help='best of N rounds')
+    args = parser.parse_args()
+
+    timestamps = make_timestamps(args.count)
+    baseline, expected = best_of(strptime_path, timestamps, args.rounds)
+    print(f'{"strptime":<16} {baseline:.3f}s')
+
+    for label, func in (('sliced', sliced_uncached), ('sliced+cache', sliced_cached)):
+        seconds, result = best_of(func, timestamps, args.rounds)
+        assert result == expected, f'{label} parsed differently from strptime'
+        print(f'{label:<16} {seconds:.3f}s  x{baseline / seconds:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# End-to-end benchmark: extract, transform and (optionally) load synthetic branch files,
+# timed per stage with utils.metrics_utils, results written as JSON for regression comparison.
+# Run from sprint_2/:
+#
+#   python benchmarks/bench_pipeline.py --rows 100000 --output results/baseline.json
+#   python benchmarks/bench_pipeline.py --rows 100000 --compare results/baseline.json
+#   python benchmarks/bench_pipeline.py --rows 1000000 --load --load-mode staged
+#
+# --load needs a local Postgres (sprint_1/databases/docker-compose.yml) and POSTGRES_HOST, POSTGRES_DB,
+# POSTGRES_USER, POSTGRES_PASSWORD (and optionally POSTGRES_PORT) set. It TRUNCATEs the tables
+# before each load, so point it at a scratch database.
+# rss_increase is how much a stage raised the process's peak RSS; rounds after the first mostly stay
+# under the peak of the first, so use --rounds 1 when comparing memory.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import cuppa_chaos_etl_lambda  # noqa: E402
+import extract  # noqa: E402
+import transformation  # noqa: E402
+from utils import metrics_utils  # noqa: E402
+
+from generate_branch_files import write_branch_files  # noqa: E402
+
+
+def get_local_db_details():
+    return {
+        'host': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'database-name': os.environ.get('POSTGRES_DB'),
+        'user': os.environ.get('POSTGRES_USER'),
+        'password': os.environ.get('POSTGRES_PASSWORD'),
+        'port': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
+
+def open_files(paths):
+    handles = [open(path, newline='', encoding='utf-8') for path in paths]
+    # Same row stream as the Lambda's open_rows, file markers included
+    return handles, transformation.rows_by_source((path, extract.extract_stream(f))
+                                                  for path, f in zip(paths, handles))
+
+
+# One run: extract (materialized so it's timed on its own), transform, then load each table
+def run_once(paths, load_mode, batch_size, connection=None, cursor=None):
+    metrics = metrics_utils.PipelineMetrics(emit=lambda document: None)
+
+    handles, rows = open_files(paths)
+    try:
+        with metrics.stage('extract', rows_in=len(paths)) as stage:
+            data = list(rows)
+            stage.rows_out = len(data)
+    finally:
+        for f in handles:
+            f.close()
+
+    with metrics.stage('transform', rows_in=len(data)) as stage:
+        transformed = transformation.transformation(data, cursor)
+        stage.rows_out = sum(len(transformed[table]) for table in cuppa_chaos_etl_lambda.TABLE_COLUMNS)
+    transformation.invalidate_lookup_caches()
+
+    if connection is not None:
+        from utils import sql_utils
+        for table, columns in cuppa_chaos_etl_lambda.TABLE_COLUMNS.items():
+            with metrics.stage(f'load_{table}', rows_in=len(transformed[table])) as stage:
+                sql_utils.save_data_in_db(connection, cursor, table=table, data=transformed[table],
+                                          columns=columns, mode=load_mode, batch_size=batch_size)
+                stage.rows_out = stage.rows_in
+
+    return {stage.name: {"wall_ms": round(stage.wall_ms, 3), "cpu_ms": round(stage.cpu_ms, 3),
+                         "rows_in": stage.rows_in, "rows_out": stage.rows_out,
+                         "peak_rss_mb": round(stage.peak_rss_mb, 3),
+                         "rss_increase_mb": round(stage.rss_increase_mb, 3)}
+            for stage in metrics.stages}
+
+
+# Best wall time of N rounds per stage (the other fields come from that round)
+def best_of(runs):
+    best = {}
+    for run in runs:
+        for name, result in run.items():
+            if name not in best or result["wall_ms"] < best[name]["wall_ms"]:
+                best[name] = result
+    return best
+
+
+def run_benchmark(args, paths):
+    connection = cursor = None
+    if args.load:
+        from utils import db_utils, schema_utils
+        connection, cursor = db_utils.open_sql_database_connection_and_cursor(get_local_db_details())
+        schema_utils.ensure_schema(connection, cursor)
+
+    runs = []
+    try:
+        for _ in range(args.rounds):
+            if connection is not None:
+                cursor.execute('TRUNCATE orders, products, branches')
+                connection.commit()
+            runs.append(run_once(paths, args.load_mode, args.batch_size, connection, cursor))
+    finally:
+        if connection is not None:
+            cursor.close()
+            connection.close()
+    return best_of(runs)
+
+
+# Percent change in wall time per stage, positive is slower
+def compare(results, baseline):
+    changes = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and before["wall_ms"] > 0:
+            changes[name] = round((result["wall_ms"] - before["wall_ms"]) / before["wall_ms"] * 100, 1)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time extract, transform and load on synthetic branch files')
+    parser.add_argument('--rows', type=int, default=10_000, help='rows across all files (default: 10000)')
+    parser.add_argument('--menu-size', type=int, default=40, help='distinct basket items (default: 40)')
+    parser.add_argument('--branches', type=int, default=3, help='branch count, one file each (default: 3)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help='reuse files generated before instead of generating new ones')
+    parser.add_argument('--load', action='store_true', help='also load into the local Postgres')
+    parser.add_argument('--load-mode', default='batch', help='row | batch | staged | prepared (default: batch)')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3, help='best of N rounds (default: 3)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare wall times against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='with --compare, exit 1 if a stage is more than this percent slower (default: 10)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.data_dir:
+            paths = sorted(os.path.join(args.data_dir, name) for name in os.listdir(args.data_dir)
+                           if name.endswith('.csv'))
+        else:
+            paths = write_branch_files(tmp_dir, args.rows, args.menu_size, args.branches, args.seed)
+        results = run_benchmark(args, paths)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "params": {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'threshold')},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+
+    for name, result in results.items():
+        print(f'{name:<14} wall={result["wall_ms"]:>10.1f}ms cpu={result["cpu_ms"]:>10.1f}ms '
+              f'rows_in={result["rows_in"]} rows_out={result["rows_out"]} rss_increase={result["rss_increase_mb"]:.1f}MB '
+              f'process_peak_rss={result["peak_rss_mb"]:.1f}MB')
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline["params"] != report["params"]:
+            print(f'Warning: baseline params differ: {baseline["params"]}')
+        changes = compare(results, baseline["results"])
+        for name, change in changes.items():
+            print(f'{name:<14} {change:+.1f}% wall time vs baseline')
+        regressions = [name for name, change in changes.items() if change > args.threshold]
+        if regressions:
+            print(f'Regressions over {args.threshold}%: {regressions}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
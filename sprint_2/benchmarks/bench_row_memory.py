@@ -0,0 +1,71 @@
+# Memory per order line: the OrderRow records transform_rows produces now, against the
+# seven-key dicts it produced before, and the extra copy the loader used to make per row.
+# Also memory per extracted row with and without interning the branch and payment method.
+# Run from sprint_2/: python benchmarks/bench_row_memory.py --rows 200000
+
+import argparse
+import csv
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import extract  # noqa: E402
+import transformation  # noqa: E402
+
+from generate_branch_files import generate_rows  # noqa: E402
+
+ORDER_COLUMNS = list(transformation.OrderRow._fields)
+
+
+# Bytes still allocated after build() (what the result holds on to) and the peak while building
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory per order line: records vs dicts')
+    parser.add_argument('--rows', type=int, default=100_000, help='synthetic branch file rows (default: 100000)')
+    args = parser.parse_args()
+
+    csv_buffer = io.StringIO()
+    csv.writer(csv_buffer).writerows(generate_rows(args.rows))
+    csv_text = csv_buffer.getvalue()
+
+    # Full extract holds every row: one string per cell from csv.reader, against shared categoricals
+    _, plain_bytes, _ = measure(lambda: [row for row in csv.reader(io.StringIO(csv_text)) if row])
+    rows, interned_bytes, _ = measure(lambda: extract.extract(csv_text))
+    print(f'extract rows={len(rows)}')
+    print(f'{"plain":<10} {plain_bytes / len(rows):>7.1f} bytes/row  total={plain_bytes / 2**20:.1f}MB')
+    print(f'{"interned":<10} {interned_bytes / len(rows):>7.1f} bytes/row  total={interned_bytes / 2**20:.1f}MB')
+    print(f'saving     {(plain_bytes - interned_bytes) / len(rows):>7.1f} bytes/row '
+          f'({(1 - interned_bytes / plain_bytes) * 100:.0f}%)\n')
+
+    orders = transformation.transform_rows(rows)["orders"]
+    # The values themselves (ids, datetimes, floats) are shared by both shapes and not counted
+    # below, only the containers are
+    order_count = len(orders)
+    print(f'rows={args.rows} order_lines={order_count}\n')
+
+    _, record_bytes, _ = measure(lambda: [transformation.OrderRow(*order) for order in orders])
+    dicts, dict_bytes, _ = measure(lambda: [dict(zip(ORDER_COLUMNS, order)) for order in orders])
+    print(f'{"OrderRow":<10} {record_bytes / order_count:>7.1f} bytes/line  total={record_bytes / 2**20:.1f}MB')
+    print(f'{"dict":<10} {dict_bytes / order_count:>7.1f} bytes/line  total={dict_bytes / 2**20:.1f}MB')
+    print(f'saving     {(dict_bytes - record_bytes) / order_count:>7.1f} bytes/line '
+          f'({(1 - record_bytes / dict_bytes) * 100:.0f}%)\n')
+
+    # Loader parameters for every row, as the row mode used to build them and as it takes records now
+    _, _, dict_param_peak = measure(lambda: [[order[col] for col in ORDER_COLUMNS] for order in dicts])
+    _, _, record_param_peak = measure(lambda: list(orders))
+    print(f'loader params from dicts   {dict_param_peak / order_count:>7.1f} bytes/line')
+    print(f'loader params from records {record_param_peak / order_count:>7.1f} bytes/line (references to the records, no per-row copy)')
+
+
+if __name__ == '__main__':
+    main()
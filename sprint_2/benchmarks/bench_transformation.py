@@ -0,0 +1,215 @@
+# Compare CPU time of the old multi-pass transformation against the single-pass engine.
+# Run from sprint_2/: python benchmarks/bench_transformation.py --repeat 50
+
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import transformation  # noqa: E402
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sprint_1', 'data')
+
+
+# Stands in for a DB cursor on an empty database
+class EmptyCursor:
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return []
+
+
+def load_sample_rows(repeat):
+    rows = []
+    for file_name in sorted(os.listdir(SAMPLE_DATA_DIR)):
+        with open(os.path.join(SAMPLE_DATA_DIR, file_name), newline='', encoding='utf-8') as f:
+            rows.extend(row for row in csv.reader(f) if row)
+    return rows * repeat
+
+
+# The multi-pass transformation as it was before the single-pass engine, copied here unchanged so the
+# comparison keeps measuring the old code: no parse caches, strptime, re.match and uuid4 ids.
+# (It multiplies the price string by the quantity, as the old code did.)
+def legacy_remove_sensitive_info(rows):
+    cleaned_rows = [["datetime", "branch", "product", "total_price", "payment_method"]]
+    for row in rows:
+        if len(row) < 6:
+            continue
+        datetime_val, branch, _, product, total_price, payment_method, *_ = row
+        cleaned_rows.append([datetime_val, branch, product, total_price, payment_method])
+    return cleaned_rows
+
+
+def legacy_parse_products(rows):
+    parsed_list = []
+    for row_num, row in enumerate(rows[1:], start=2):
+        products_str = row[2].strip()
+        if not products_str:
+            continue
+        product_items = [p.strip() for p in products_str.split(',')]
+        for p in product_items:
+            parts = [x.strip() for x in p.split(' - ')]
+            if len(parts) == 3:
+                type_size, flavour, price = parts
+            elif len(parts) == 2:
+                type_size, price = parts
+                flavour = None
+            else:
+                continue
+
+            match = re.match(r"(Regular|Large)\s+(.*)", type_size.title())
+            if match:
+                size, type_name = match.groups()
+            else:
+                size = None
+                type_name = type_size.title()
+
+            parsed_list.append({
+                "size": size,
+                "name": type_name,
+                "flavour": flavour.title() if flavour else None,
+                "price": float(price)
+            })
+    return parsed_list
+
+
+def legacy_drop_duplicate_product_values(parsed_list, cursor):
+    seen = transformation.get_existing_products(cursor)
+    unique_rows = []
+    for row in parsed_list:
+        key = (row['name'], row['size'], row['flavour'])
+        if key in seen:
+            row['product_id'] = seen[key]
+        else:
+            row['product_id'] = str(uuid.uuid4())
+            seen[key] = row['product_id']
+            unique_rows.append(row)
+    return unique_rows
+
+
+def legacy_normalize_branches(rows, cursor):
+    branch_list = []
+    seen = transformation.get_existing_branches(cursor)
+    for row in rows[1:]:
+        branch_name = row[1]
+        if branch_name not in seen:
+            branch_id = str(uuid.uuid4())
+            seen[branch_name] = branch_id
+            branch_list.append({"branch_id": branch_id, "branch_name": branch_name})
+    return branch_list
+
+
+def legacy_normalize_orders(rows, products_table, branches_table):
+    normalised_orders = []
+
+    product_lookup = {(p['name'], p['size'], p['flavour']): p['product_id'] for p in products_table}
+    branch_lookup = {b['branch_name']: b['branch_id'] for b in branches_table}
+
+    for row in rows[1:]:
+        datetime_str, branch_name, products_str, total_price, payment_method = row
+        if not datetime_str or not products_str:
+            continue
+
+        try:
+            order_date = datetime.strptime(datetime_str, "%d/%m/%Y %H:%M")
+        except ValueError:
+            continue
+
+        branch_id = branch_lookup.get(branch_name)
+        if not branch_id:
+            continue
+
+        product_items = [p.strip() for p in products_str.split(',')]
+        quantity_counter = defaultdict(int)
+        product_prices = {}
+
+        for p in product_items:
+            parts = [x.strip() for x in p.split(' - ')]
+            if len(parts) == 3:
+                type_size, flavour, price = parts
+            elif len(parts) == 2:
+                type_size, price = parts
+                flavour = None
+            else:
+                continue
+
+            match = re.match(r"(Regular|Large)\s+(.*)", type_size.title())
+            if match:
+                size, name = match.groups()
+            else:
+                size = None
+                name = type_size.title()
+
+            key = (name, size, flavour.title() if flavour else None)
+            product_id = product_lookup.get(key)
+            if not product_id:
+                continue
+
+            quantity_counter[product_id] += 1
+            product_prices[product_id] = (price)
+
+        order_id = str(uuid.uuid4())
+        for product_id, qty in quantity_counter.items():
+            normalised_orders.append({
+                "order_id": order_id,
+                "branch_id": branch_id,
+                "product_id": product_id,
+                "quantity": qty,
+                "order_date": order_date,
+                "total_price": product_prices[product_id] * qty,
+                "payment_method": payment_method
+            })
+
+    return normalised_orders
+
+
+def multi_pass(rows):
+    cursor = EmptyCursor()
+    removed_pii = legacy_remove_sensitive_info(rows)
+    parsed = legacy_parse_products(removed_pii)
+    products = legacy_drop_duplicate_product_values(parsed, cursor)
+    branches = legacy_normalize_branches(removed_pii, cursor)
+    orders = legacy_normalize_orders(removed_pii, products, branches)
+    return {"products": products, "branches": branches, "orders": orders}
+
+
+def single_pass(rows):
+    return transformation.transform_rows(rows, EmptyCursor())
+
+
+def time_cpu(func, rows, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.process_time()
+        result = func(rows)
+        elapsed = time.process_time() - start
+        transformation.invalidate_lookup_caches()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-pass vs single-pass transformation CPU time')
+    parser.add_argument('--repeat', type=int, default=50, help='how many copies of the sample files to process')
+    parser.add_argument('--rounds', type=int, default=3, help='best of N rounds')
+    args = parser.parse_args()
+
+    rows = load_sample_rows(args.repeat)
+    print(f'rows={len(rows)}')
+
+    for label, func in (('multi_pass', multi_pass), ('single_pass', single_pass)):
+        seconds, result = time_cpu(func, rows, args.rounds)
+        print(f'{label:<12} cpu={seconds:.3f}s products={len(result["products"])} '
+              f'branches={len(result["branches"])} orders={len(result["orders"])}')
+
+
+if __name__ == '__main__':
+    main()
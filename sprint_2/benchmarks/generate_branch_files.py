@@ -0,0 +1,110 @@
+# Synthetic branch files in the same 7-column format as the real ones (sprint_1/data):
+#   date time, branch, customer name, "basket", total price, CASH|CARD, card number (empty for cash)
+# Output only depends on the arguments and the seed, so benchmark runs are comparable.
+# Rows are written as they are generated, 10M rows is fine memory-wise (~1GB on disk).
+#
+#   python benchmarks/generate_branch_files.py --rows 100000 --menu-size 60 --branches 5 --out /tmp/branches
+
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+DRINKS = [
+    ("Latte", 2.15), ("Flat white", 2.15), ("Cappuccino", 2.15), ("Americano", 1.95), ("Iced americano", 2.15),
+    ("Filter coffee", 1.50), ("Mocha", 2.30), ("Cortado", 2.05), ("Espresso", 1.50), ("Macchiato", 1.65),
+    ("Chai latte", 2.30), ("Hot chocolate", 2.60), ("Smoothie", 2.00), ("Frappes", 2.75), ("Glass of milk", 0.70),
+    ("Flavoured latte", 2.55), ("Flavoured iced latte", 2.75), ("Flavoured hot chocolate", 2.60),
+    ("Speciality Tea", 1.30), ("Red Label tea", 1.20),
+]
+SYRUPS = ["Vanilla", "Caramel", "Hazelnut", "Gingerbread", "Peppermint", "Coconut", "Almond", "Cinnamon", "Toffee",
+          "Orange"]
+TEAS = ["Green", "English breakfast", "Fruit", "Camomile", "Peppermint", "Earl grey"]
+SIZES = [("Regular", 0.0), ("Large", 0.30)]
+TOWNS = ["Chesterfield", "Leeds", "Uppingham", "Sheffield", "York", "Derby", "Nottingham", "Leicester", "Lincoln",
+         "Hull", "Bradford", "Wakefield", "Doncaster", "Harrogate", "Durham", "Newcastle", "Carlisle", "Preston"]
+FIRST_NAMES = ["Richard", "Scott", "Francis", "Rodney", "Michael", "Jerome", "Ronald", "Joseph", "Liliana", "Frank",
+               "Benjamin", "Angela", "Alfred", "Rosetta", "Diane", "Priya", "Chloe", "Tomasz", "Aisha", "Mei"]
+LAST_NAMES = ["Copeland", "Owens", "Strayhorn", "Drake", "Sparrow", "Soper", "Moss", "Mccabe", "Nolan", "Nistler",
+              "Moyer", "Tran", "Reid", "Gamez", "Natalie", "Patel", "Kowalski", "Okafor", "Chen", "Evans"]
+START_DATE = datetime(2023, 5, 9, 8, 0)
+
+
+# menu_size distinct basket items ("Large Flavoured latte - Caramel - 2.85"), sizes x drinks x flavours
+def build_menu(menu_size, rng):
+    items = []
+    for drink, price in DRINKS:
+        flavours = SYRUPS if drink.startswith("Flavoured") else TEAS if drink == "Speciality Tea" else [None]
+        for flavour in flavours:
+            for size, extra in SIZES:
+                name = f'{size} {drink} - {flavour}' if flavour else f'{size} {drink}'
+                items.append((name, round(price + extra, 2)))
+    if menu_size > len(items):
+        raise ValueError(f'menu_size={menu_size} is more than the {len(items)} items the generator knows')
+    rng.shuffle(items)
+    return [(f'{name} - {price:.2f}', price) for name, price in items[:menu_size]]
+
+
+# Branch names are town names, numbered once the towns run out ("Leeds 2")
+def build_branches(branch_count):
+    return [TOWNS[i % len(TOWNS)] + (f' {i // len(TOWNS) + 1}' if i >= len(TOWNS) else '')
+            for i in range(branch_count)]
+
+
+def generate_rows(rows, menu_size=40, branch_count=3, seed=42, max_basket=5):
+    rng = random.Random(seed)
+    menu = build_menu(menu_size, rng)
+    branches = build_branches(branch_count)
+    clocks = [START_DATE] * branch_count
+    # A few popular items take most orders, as in the real files
+    weights = [1.0 / (rank + 1) for rank in range(len(menu))]
+
+    for _ in range(rows):
+        branch_index = rng.randrange(branch_count)
+        clocks[branch_index] += timedelta(minutes=rng.randint(1, 3))
+        basket = rng.choices(menu, weights=weights, k=rng.randint(1, max_basket))
+        total_price = round(sum(price for _, price in basket), 2)
+        payment_method = 'CARD' if rng.random() < 0.7 else 'CASH'
+        card_number = str(rng.randrange(10 ** 15, 10 ** 16)) if payment_method == 'CARD' else ''
+        yield [
+            clocks[branch_index].strftime('%d/%m/%Y %H:%M'),
+            branches[branch_index],
+            f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            ', '.join(item for item, _ in basket),
+            str(total_price),
+            payment_method,
+            card_number,
+        ]
+
+
+# One file per branch, like the files the branches upload. Returns the file paths.
+def write_branch_files(out_dir, rows, menu_size=40, branch_count=3, seed=42):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, f'{name.lower().replace(" ", "_")}.csv') for name in build_branches(branch_count)]
+    files = [open(path, 'w', newline='', encoding='utf-8') for path in paths]
+    try:
+        writers = {name: csv.writer(f) for name, f in zip(build_branches(branch_count), files)}
+        for row in generate_rows(rows, menu_size, branch_count, seed):
+            writers[row[1]].writerow(row)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic branch CSV files')
+    parser.add_argument('--rows', type=int, default=10_000, help='rows across all files (default: 10000)')
+    parser.add_argument('--menu-size', type=int, default=40, help='distinct basket items (default: 40)')
+    parser.add_argument('--branches', type=int, default=3, help='branch count, one file each (default: 3)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', required=True, help='output directory')
+    args = parser.parse_args()
+
+    paths = write_branch_files(args.out, args.rows, args.menu_size, args.branches, args.seed)
+    print(f'Wrote rows={args.rows} to {len(paths)} files in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
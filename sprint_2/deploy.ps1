@@ -55,6 +55,14 @@ else {
     Write-Output "Skipping pip install"
 }
 
+# Keep the lambda zip to what the handler imports: pip leaves console scripts, package metadata
+# and bytecode caches in src/, and boto3 (with jmespath, dateutil, six) is already in the Lambda runtime
+Write-Output ""
+Write-Output "Cleaning up src..."
+Remove-Item -Recurse -Force -ErrorAction SilentlyContinue ./src/bin, ./src/*.dist-info, ./src/six.py, ./src/jmespath, ./src/dateutil
+Get-ChildItem ./src -Recurse -Force -Directory -Filter __pycache__ | Remove-Item -Recurse -Force
+Get-ChildItem ./src -Recurse -Force -File -Filter .DS_Store | Remove-Item -Force
+
 # Create an updated ETL packaged template "etl-stack-packaged.yml" from the default "etl-stack.yml"
 # ...and upload local resources to S3 (e.g zips files of your lambdas)
 # A unique S3 filename is automatically generated each time
@@ -41,6 +41,14 @@ else
     echo "Skipping pip install"
 fi
 
+# Keep the lambda zip to what the handler imports: pip leaves console scripts, package metadata
+# and bytecode caches in src/, and boto3 (with jmespath, dateutil, six) is already in the Lambda runtime
+echo ""
+echo "Cleaning up src..."
+rm -rf ./src/bin ./src/*.dist-info ./src/six.py ./src/jmespath ./src/dateutil
+find ./src -name "__pycache__" -type d -prune -exec rm -rf {} +
+find ./src -name ".DS_Store" -type f -delete
+
 # Create an updated ETL packaged template "etl-stack-packaged.yml" from the default "etl-stack.yml"
 # ...and upload local resources to S3 (e.g zips files of your lambdas)
 # A unique S3 filename is automatically generated each time
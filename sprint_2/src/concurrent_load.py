@@ -0,0 +1,97 @@
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from utils import metrics_utils, sql_utils
+
+
+LOGGER = logging.getLogger()
+
+LOGGER.setLevel(logging.INFO)
+
+# Load the transformed tables over several connections at once instead of one table after another:
+#   1. the dimension tables (products, branches) concurrently, one connection each
+#   2. the fact table (orders) split into one shard per connection by a hash of order_id,
+#      so every line of an order lands in the same shard and shards never touch the same rows
+# The driver releases the GIL while it waits on the database, so the threads really overlap.
+#
+# Each connection commits its own part. Dimensions are committed before any order is inserted,
+# because another connection's uncommitted rows don't satisfy the orders foreign keys.
+# There is no cross-connection commit (Redshift has no two-phase commit); instead every row has
+# a deterministic id and inserts are ON CONFLICT DO NOTHING, so if some part fails the caller
+# records nothing in the processed_files ledger, and the retry re-inserts only the missing rows.
+# The caller writes the ledger rows last, after every part is committed.
+
+FACT_TABLE = "orders"
+
+
+def shard_index(order_id, shard_count):
+    return zlib.crc32(order_id.encode('utf-8')) % shard_count
+
+
+def shard_rows(rows, shard_count):
+    shards = [[] for _ in range(shard_count)]
+    for row in rows:
+        shards[shard_index(row.order_id, shard_count)].append(row)
+    return shards
+
+
+def load_table(connection, table, rows, columns, mode, batch_size):
+    cursor = connection.cursor()
+    try:
+        sql_utils.save_data_in_db(connection, cursor,
+                                  table=table,
+                                  data=rows,
+                                  columns=columns,
+                                  mode=mode,
+                                  batch_size=batch_size,
+                                  commit=True)
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+# Run the loads and wait for all of them, then raise the first error (if any).
+# Waiting for the rest keeps a failed run from leaving threads that still use the connections.
+def run_all(executor, loads):
+    futures = [executor.submit(load_table, *load) for load in loads]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return sum(future.result() for future in futures)
+
+
+def timed_stage(metrics, name, rows_in):
+    if metrics is None:
+        return nullcontext(metrics_utils.StageMetrics(name, rows_in))
+    return metrics.stage(name, rows_in=rows_in)
+
+
+# transformed_data: {table: records}; table_columns: {table: columns}; load_mode: function of the table name
+def load_concurrently(connections, transformed_data, table_columns, load_mode, batch_size=500, metrics=None):
+    if not connections:
+        raise ValueError("load_concurrently: needs at least one connection")
+
+    dimension_tables = [table for table in table_columns if table != FACT_TABLE]
+    LOGGER.info(f'load_concurrently: connections={len(connections)}, dimensions={dimension_tables}')
+
+    with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+        # In waves of one table per connection, a connection never runs two loads at once
+        dimension_rows = sum(len(transformed_data[table]) for table in dimension_tables)
+        with timed_stage(metrics, 'load_dimensions', dimension_rows) as stage:
+            stage.rows_out = 0
+            for start in range(0, len(dimension_tables), len(connections)):
+                wave = dimension_tables[start:start + len(connections)]
+                stage.rows_out += run_all(executor, [(connection, table, transformed_data[table], table_columns[table],
+                                                      load_mode(table), batch_size)
+                                                     for connection, table in zip(connections, wave)])
+
+        shards = shard_rows(transformed_data[FACT_TABLE], len(connections))
+        fact_loads = [(connection, FACT_TABLE, shard, table_columns[FACT_TABLE], load_mode(FACT_TABLE), batch_size)
+                      for connection, shard in zip(connections, shards) if shard]
+        with timed_stage(metrics, f'load_{FACT_TABLE}', len(transformed_data[FACT_TABLE])) as stage:
+            stage.rows_out = run_all(executor, fact_loads)
+
+    LOGGER.info(f'load_concurrently: done, shards={[len(shard) for shard in shards]}')
@@ -1,8 +1,8 @@
 import logging
 import os
 import json
-from utils import s3_utils, db_utils, sql_utils
-import extract, transformation
+from utils import s3_utils, db_utils, sql_utils, schema_utils, metrics_utils
+import extract, transformation, pipeline, concurrent_load
 
 
 
@@ -10,6 +10,82 @@ LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
 SSM_ENV_VAR_NAME = 'SSM_PARAMETER_NAME'
+LOAD_MODE_ENV_VAR_NAME = 'LOAD_MODE'
+LOAD_BATCH_SIZE_ENV_VAR_NAME = 'LOAD_BATCH_SIZE'
+EXTRACT_MODE_ENV_VAR_NAME = 'EXTRACT_MODE'
+FETCH_MAX_WORKERS_ENV_VAR_NAME = 'FETCH_MAX_WORKERS'
+# Ids are deterministic, the DB lookups are only needed to reuse ids of rows loaded before that (uuid4)
+RECONCILE_EXISTING_IDS_ENV_VAR_NAME = 'RECONCILE_EXISTING_IDS'
+# Rows per chunk for the pipelined executor (pipeline.py), 0 runs the stages one after another
+PIPELINE_CHUNK_ROWS_ENV_VAR_NAME = 'PIPELINE_CHUNK_ROWS'
+# Connections to load over at once (concurrent_load.py), 1 loads every table on the handler's connection
+LOAD_CONNECTIONS_ENV_VAR_NAME = 'LOAD_CONNECTIONS'
+
+# Load order matters: orders reference products and branches.
+# The columns are the record fields, so the loader can pass the records through as they are.
+TABLE_COLUMNS = {
+    "products": list(transformation.ProductRow._fields),
+    "branches": list(transformation.BranchRow._fields),
+    "orders": list(transformation.OrderRow._fields),
+}
+
+
+# Load mode per table: LOAD_MODE_ORDERS=row overrides LOAD_MODE for the orders table only
+def get_load_mode(table):
+    default_mode = os.environ.get(LOAD_MODE_ENV_VAR_NAME, 'batch')
+    return os.environ.get(f'{LOAD_MODE_ENV_VAR_NAME}_{table.upper()}', default_mode)
+
+# The raw rows of all files for either executor, and the name of the stage that produces them.
+# The S3 requests are made here, in the fetch stage:
+#   stream: only the get_object calls, the bodies are read and parsed lazily as the rows are pulled
+#   full: the whole files are read into memory, the rows are parsed lazily
+def open_rows(files, metrics, stream, max_workers):
+    with metrics.stage('fetch', rows_in=len(files)) as stage:
+        if stream:
+            sources = s3_utils.stream_files(files, max_workers)
+        else:
+            sources = s3_utils.load_files(files, max_workers)
+        stage.rows_out = len(sources)
+
+    # Order ids are numbered per file, so the transform has to see where each file starts
+    if stream:
+        return 'fetch_extract', transformation.rows_by_source(
+            (file.key, extract.extract_stream(lines)) for file, lines in zip(files, sources))
+    return 'extract', transformation.rows_by_source(
+        (file.key, extract.extract(csv_text)) for file, csv_text in zip(files, sources))
+
+# The stages one after another: all rows are extracted and transformed, then each table is loaded.
+# With load_connections the tables are loaded concurrently and committed on those connections.
+def transform_and_load(conn, cur, files, metrics, stream, max_workers, reconcile, batch_size, load_connections=None):
+    stage_name, rows = open_rows(files, metrics, stream, max_workers)
+    data = metrics.timed_iter(stage_name, rows)
+
+    # PII drop, parsing, dedup and normalizing happen in one pass over the rows, so they are one stage.
+    # Its wall time includes the time spent pulling rows from the extract stage above.
+    with metrics.stage('transform') as stage:
+        transformed_data = transformation.transformation(data, cur if reconcile else None)
+        stage.rows_out = sum(len(transformed_data[table]) for table in TABLE_COLUMNS)
+
+    LOGGER.info('lambda_handler: transformed')
+
+    if load_connections:
+        concurrent_load.load_concurrently(load_connections, transformed_data, TABLE_COLUMNS, get_load_mode,
+                                          batch_size, metrics)
+        return transformed_data
+
+    for table, columns in TABLE_COLUMNS.items():
+        mode = get_load_mode(table)
+        LOGGER.info(f'lambda_handler: loading table={table}, mode={mode}, batch_size={batch_size}')
+        with metrics.stage(f'load_{table}', rows_in=len(transformed_data[table])) as stage:
+            sql_utils.save_data_in_db(conn, cur,
+                                        table=table,
+                                        data=transformed_data[table],
+                                        columns=columns,
+                                        mode=mode,
+                                        batch_size=batch_size,
+                                        commit=False)
+            stage.rows_out = stage.rows_in
+    return transformed_data
 
 def lambda_handler(event, context):
 
@@ -18,44 +94,98 @@ def lambda_handler(event, context):
 
     try:
 
-        bucket_name, file_path = s3_utils.get_file_info(event)
+        max_workers = int(os.environ.get(FETCH_MAX_WORKERS_ENV_VAR_NAME, s3_utils.FETCH_MAX_WORKERS))
 
-        csv_text = s3_utils.load_file(bucket_name, file_path)
+        # A batched S3/SQS event can carry several branch files, they are transformed and loaded as one unit.
+        # The same object can appear twice in a batch when S3 redelivers, keep the first.
+        files = list(dict.fromkeys(s3_utils.add_missing_etags(s3_utils.get_files_info(event), max_workers)))
+        file_path = ', '.join(f'{file.bucket_name}/{file.key}' for file in files)
+        if not files:
+            LOGGER.warning('lambda_handler: no S3 files in event, nothing to do')
+            return
 
-        data = extract.extract(csv_text)
+        # One EMF document per stage on stdout, see utils/metrics_utils.py
+        metrics = metrics_utils.PipelineMetrics(properties={"Files": file_path})
 
         ssm_param_name = os.environ.get(SSM_ENV_VAR_NAME, 'NOT_SET')
         LOGGER.info(f'lambda_handler: ssm_param_name={ssm_param_name} from ssm_env_var_name={SSM_ENV_VAR_NAME}')
-        redshift_details = db_utils.get_ssm_param(ssm_param_name)
-        conn, cur = db_utils.open_sql_database_connection_and_cursor(redshift_details)
-
-        sql_utils.create_db_tables(conn, cur)
-
-        transformed_data = transformation.transformation(data, cur)
-
-        LOGGER.info(f'lambda_handler: done, file={file_path}')
-
-        LOGGER.warning(f'lambda_handler: transformed_data={transformed_data}')
-
-        
-        sql_utils.save_data_in_db(conn, cur,
-                                    table="products",
-                                    data=transformed_data["products"],
-                                    columns=["product_id", "name", "size", "flavour", "price"])
-        sql_utils.save_data_in_db(conn, cur,
-                                    table="branches",
-                                    data=transformed_data["branches"],
-                                    columns=["branch_id", "branch_name"])
-        sql_utils.save_data_in_db(conn, cur,
-                                    table="orders",
-                                    data=transformed_data["orders"],
-                                    columns=["order_id", "branch_id", "product_id", "quantity", "order_date", "total_price", "payment_method"])
-
+        conn, cur = db_utils.get_connection_and_cursor_from_ssm(ssm_param_name)
+
+        # Only hits the database on the first invocation of a container (or after a new migration ships)
+        schema_utils.ensure_schema(conn, cur)
+
+        # Skip files already loaded (same bucket, key and ETag) before downloading anything
+        with metrics.stage('ledger_check', rows_in=len(files)) as stage:
+            processed = sql_utils.get_processed_files(cur, files)
+            stage.rows_out = len(files) - len(processed)
+        files = [file for file in files if file not in processed]
+        if processed:
+            LOGGER.info(f'lambda_handler: skipping already processed files={[file.key for file in processed]}')
+        if not files:
+            conn.rollback()
+            cur.close()
+            LOGGER.info(f'lambda_handler: nothing new to load, file={file_path}')
+            return
+        file_path = ', '.join(f'{file.bucket_name}/{file.key}' for file in files)
+        metrics.properties["Files"] = file_path
+
+        # Only with LOAD_MODE=prepared for some table: statements prepared vs executed by this invocation
+        prepared_tables = [table for table in TABLE_COLUMNS if get_load_mode(table) == 'prepared']
+        prepared_before = sql_utils.prepared_statement_stats()
+
+        # stream: rows are parsed lazily off the S3 bodies as transformation consumes them,
+        #   so reading the bodies is part of the fetch_extract stage
+        # full: the whole files are read into memory first (previous behaviour), see open_rows
+        stream = os.environ.get(EXTRACT_MODE_ENV_VAR_NAME, 'stream') == 'stream'
+        reconcile = os.environ.get(RECONCILE_EXISTING_IDS_ENV_VAR_NAME, 'true').lower() == 'true'
+        batch_size = int(os.environ.get(LOAD_BATCH_SIZE_ENV_VAR_NAME, '500'))
+        chunk_rows = int(os.environ.get(PIPELINE_CHUNK_ROWS_ENV_VAR_NAME, '0'))
+        connection_count = int(os.environ.get(LOAD_CONNECTIONS_ENV_VAR_NAME, '1'))
+
+        # One transaction for all tables and the ledger rows: either the files are fully loaded
+        # and recorded, or nothing is and a retry starts clean.
+        # With LOAD_CONNECTIONS > 1 the tables are committed first on their own connections and
+        # the ledger rows after them, see concurrent_load.py.
+        if chunk_rows > 0:
+            # Fetch/extract, transform and load overlap chunk by chunk, all on the handler's connection
+            if connection_count > 1:
+                LOGGER.warning(f'lambda_handler: {LOAD_CONNECTIONS_ENV_VAR_NAME}={connection_count} is ignored '
+                               f'with {PIPELINE_CHUNK_ROWS_ENV_VAR_NAME}={chunk_rows}, loading on one connection')
+            _, data = open_rows(files, metrics, stream, max_workers)
+            result = pipeline.Pipeline(conn, cur, TABLE_COLUMNS, reconcile=reconcile, load_mode=get_load_mode,
+                                       batch_size=batch_size, chunk_rows=chunk_rows).run(data, metrics)
+            loaded_data = {"products": result.products, "branches": result.branches}
+        else:
+            load_connections = None
+            if connection_count > 1:
+                load_connections = db_utils.get_load_connections(db_utils.get_ssm_param(ssm_param_name),
+                                                                 connection_count)
+            loaded_data = transform_and_load(conn, cur, files, metrics, stream, max_workers, reconcile, batch_size,
+                                             load_connections)
+
+        with metrics.stage('commit', rows_in=len(files)):
+            sql_utils.record_processed_files(cur, files)
+            conn.commit()
+
+        # Warm runs should prepare none
+        if prepared_tables:
+            prepared_after = sql_utils.prepared_statement_stats()
+            metrics.record_counts('prepared_statements', {
+                "PreparedStatementChecks": prepared_after["checks"] - prepared_before["checks"],
+                "PreparedStatementPrepares": prepared_after["prepares"] - prepared_before["prepares"],
+                "PreparedStatementExecutes": prepared_after["executes"] - prepared_before["executes"],
+            })
+
+        transformation.remember_loaded(loaded_data)
+
+        # The connection stays open for the next warm invocation
         cur.close()
-        conn.close()
 
-        LOGGER.info(f'lambda_handler: done, file={file_path}')
+        LOGGER.info(f'lambda_handler: done, file={file_path}, stages: {metrics.summary()}')
 
     except Exception as err:
         LOGGER.error(f"lambda_handler: failure: {err=}, {type(err)=}, file={file_path}")
+        transformation.invalidate_lookup_caches()
+        db_utils.discard_connection()
+        db_utils.discard_load_connections()
         raise err
\ No newline at end of file
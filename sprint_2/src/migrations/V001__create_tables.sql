@@ -0,0 +1,36 @@
+-- Version 1: products, branches and orders.
+-- This folder is the single source of the schema: utils/schema_utils.py applies new
+-- versions from the Lambda, and sprint_1/databases/docker-compose.yml mounts it as the
+-- init scripts of the local Postgres. Add changes as a new V<next>__<name>.sql file,
+-- never edit an applied one. Each file records its own version in schema_version.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    description VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    product_id VARCHAR(36) PRIMARY KEY,
+    name VARCHAR(50) NOT NULL,
+    size VARCHAR(50),
+    flavour VARCHAR(50),
+    price DECIMAL(10, 2) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS branches (
+    branch_id VARCHAR(36) PRIMARY KEY,
+    branch_name VARCHAR(50) UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    order_id VARCHAR(36) NOT NULL,
+    branch_id VARCHAR(36) NOT NULL REFERENCES branches(branch_id),
+    product_id VARCHAR(36) NOT NULL REFERENCES products(product_id),
+    quantity INT NOT NULL DEFAULT 1,
+    order_date TIMESTAMP NOT NULL,
+    total_price DECIMAL(10, 2) NOT NULL,
+    payment_method VARCHAR(10) NOT NULL,
+    PRIMARY KEY (order_id, product_id)
+);
+
+INSERT INTO schema_version (version, description) VALUES (1, 'create products, branches and orders');
@@ -0,0 +1,13 @@
+-- Version 2: ledger of loaded S3 files.
+-- A row is written in the same transaction as the file's orders, so a redelivered
+-- or re-uploaded identical file (same ETag) is skipped before it is even downloaded.
+
+CREATE TABLE IF NOT EXISTS processed_files (
+    bucket_name VARCHAR(255) NOT NULL,
+    file_key VARCHAR(1024) NOT NULL,
+    etag VARCHAR(100) NOT NULL,
+    processed_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (bucket_name, file_key, etag)
+);
+
+INSERT INTO schema_version (version, description) VALUES (2, 'create processed_files');
@@ -0,0 +1,18 @@
+-- Brings tables created by the old sql_utils.create_db_tables (before schema_version existed)
+-- to the shape of V001__create_tables.sql. Not a numbered version: V001 only creates missing
+-- tables, so schema_utils.ensure_schema runs this whenever it finds the old orders.order_time
+-- column, whatever version the database has recorded. It is in a subfolder so the local
+-- Postgres container, which runs the top level files on boot, never sees it.
+-- Written without DO blocks or ALTER COLUMN TYPE so it runs in one transaction on Redshift too.
+
+-- orders: order_time -> order_date, and one row per order line instead of per order
+ALTER TABLE orders RENAME COLUMN order_time TO order_date;
+ALTER TABLE orders DROP CONSTRAINT orders_pkey;
+ALTER TABLE orders ADD PRIMARY KEY (order_id, product_id);
+
+-- branches: VARCHAR(20) -> VARCHAR(50) UNIQUE, by copying into a new column
+ALTER TABLE branches RENAME COLUMN branch_name TO branch_name_old;
+ALTER TABLE branches ADD COLUMN branch_name VARCHAR(50) NOT NULL DEFAULT '';
+UPDATE branches SET branch_name = branch_name_old;
+ALTER TABLE branches DROP COLUMN branch_name_old;
+ALTER TABLE branches ADD UNIQUE (branch_name);
@@ -0,0 +1,205 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from itertools import islice
+
+import transformation
+from utils import metrics_utils, sql_utils
+
+
+LOGGER = logging.getLogger()
+
+LOGGER.setLevel(logging.INFO)
+
+# Pipelined version of extract -> transform -> load for one invocation. The rows are cut into chunks
+# and each stage runs on its own thread with a bounded queue in between, so while chunk N is being
+# inserted, chunk N+1 is transformed and chunk N+2 is downloaded and parsed:
+#
+#   [fetch + extract] --chunks--> [transform] --tables--> [load, caller's thread]
+#
+# Threads only help where a stage waits on the network (S3 reads, DB round trips release the GIL),
+# the parsing stages still take turns on the one interpreter.
+# The transform keeps its state across chunks (transformation.RowTransformer), and each chunk loads
+# products and branches before its orders, so the tables end up the same as the sequential handler's.
+# Nothing is committed here: the caller commits once, with the ledger rows, as before.
+
+DEFAULT_CHUNK_ROWS = 5000
+# Chunks waiting between two stages; bounds memory to a few chunks whatever the file size
+QUEUE_SIZE = 2
+
+# New products and branches (for transformation.remember_loaded) and rows inserted per table
+PipelineResult = namedtuple('PipelineResult', ['products', 'branches', 'row_counts', 'chunks'])
+
+_DONE = object()
+
+
+class _StageFailed:
+
+    def __init__(self, error):
+        self.error = error
+
+
+def chunked(rows, chunk_rows):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Wall time and this thread's CPU time spent in the stage, summed over the chunks.
+# process_time would count the other stages' threads too.
+class _StageTimer:
+
+    def __init__(self, name):
+        self.stage = metrics_utils.StageMetrics(name, rows_in=0)
+        self.stage.rows_out = 0
+
+    def __enter__(self):
+        self._start_wall, self._start_cpu = time.perf_counter(), time.thread_time()
+        return self.stage
+
+    def __exit__(self, *exc_info):
+        self.stage.wall_ms += (time.perf_counter() - self._start_wall) * 1000
+        self.stage.cpu_ms += (time.thread_time() - self._start_cpu) * 1000
+        return False
+
+
+class Pipeline:
+
+    def __init__(self, connection, cursor, table_columns, reconcile=True, load_mode="batch", batch_size=500,
+                 chunk_rows=DEFAULT_CHUNK_ROWS, queue_size=QUEUE_SIZE):
+        self.connection = connection
+        self.cursor = cursor
+        # {table: columns} in load order
+        self.table_columns = table_columns
+        self.reconcile = reconcile
+        # a mode for every table, or a function of the table name (see cuppa_chaos_etl_lambda.get_load_mode)
+        self.load_mode = load_mode if callable(load_mode) else (lambda table: load_mode)
+        self.batch_size = batch_size
+        self.chunk_rows = chunk_rows
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+
+    # Blocks while the queue is full, gives up once another stage has failed
+    def _put(self, out_queue, item):
+        while not self._stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Blocks until the stage before hands something over; _DONE if the pipeline was stopped meanwhile
+    def _get(self, in_queue):
+        while True:
+            try:
+                item = in_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _DONE
+        if isinstance(item, _StageFailed):
+            raise item.error
+        return item
+
+    def _extract_stage(self, rows, out_queue, timer):
+        try:
+            chunks = chunked(rows, self.chunk_rows)
+            while True:
+                with timer as stage:
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                stage.rows_out += len(chunk)
+                if not self._put(out_queue, chunk):
+                    return
+            self._put(out_queue, _DONE)
+        except Exception as ex:
+            LOGGER.error(f'Pipeline: extract stage failed: {ex}')
+            self._put(out_queue, _StageFailed(ex))
+
+    def _transform_stage(self, in_queue, out_queue, timer):
+        try:
+            # Its own cursor: lookups for keys missing from the caches run while the load stage
+            # uses the other one. psycopg2 serializes the two on the connection.
+            cursor = self.connection.cursor() if self.reconcile else None
+            transformer = transformation.RowTransformer(cursor)
+            try:
+                while True:
+                    chunk = self._get(in_queue)
+                    if chunk is _DONE:
+                        break
+                    with timer as stage:
+                        tables = transformer.transform(chunk)
+                    stage.rows_in += len(chunk)
+                    stage.rows_out += sum(len(rows) for rows in tables.values())
+                    if not self._put(out_queue, tables):
+                        return
+            finally:
+                if cursor is not None:
+                    cursor.close()
+            self._put(out_queue, _DONE)
+        except Exception as ex:
+            LOGGER.error(f'Pipeline: transform stage failed: {ex}')
+            self._put(out_queue, _StageFailed(ex))
+
+    # rows: raw branch file rows, e.g. a lazy extract.extract_stream chain over the S3 bodies
+    def run(self, rows, metrics=None):
+        LOGGER.info(f'Pipeline: starting, chunk_rows={self.chunk_rows}, queue_size={self.queue_size}')
+        self._stop.clear()
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        table_queue = queue.Queue(maxsize=self.queue_size)
+        extract_timer = _StageTimer('fetch_extract')
+        transform_timer = _StageTimer('transform')
+        load_timers = {table: _StageTimer(f'load_{table}') for table in self.table_columns}
+
+        workers = [
+            threading.Thread(target=self._extract_stage, args=(rows, chunk_queue, extract_timer),
+                             name='pipeline-extract', daemon=True),
+            threading.Thread(target=self._transform_stage, args=(chunk_queue, table_queue, transform_timer),
+                             name='pipeline-transform', daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        products, branches = [], []
+        chunks = 0
+        try:
+            while True:
+                tables = self._get(table_queue)
+                if tables is _DONE:
+                    break
+                chunks += 1
+                for table, columns in self.table_columns.items():
+                    with load_timers[table] as stage:
+                        sql_utils.save_data_in_db(self.connection, self.cursor,
+                                                  table=table,
+                                                  data=tables[table],
+                                                  columns=columns,
+                                                  mode=self.load_mode(table),
+                                                  batch_size=self.batch_size,
+                                                  commit=False)
+                    stage.rows_in += len(tables[table])
+                    stage.rows_out += len(tables[table])
+                products.extend(tables["products"])
+                branches.extend(tables["branches"])
+        finally:
+            # Unblocks the workers if the load failed, then wait for them to let go of the connection
+            self._stop.set()
+            for worker in workers:
+                worker.join()
+
+        timers = [extract_timer, transform_timer, *load_timers.values()]
+        if metrics is not None:
+            for timer in timers:
+                timer.stage.peak_rss_mb = metrics_utils.peak_rss_mb()
+                metrics.record(timer.stage)
+
+        row_counts = {table: load_timers[table].stage.rows_out for table in self.table_columns}
+        LOGGER.info(f'Pipeline: done, chunks={chunks}, rows={row_counts}')
+        return PipelineResult(products, branches, row_counts, chunks)
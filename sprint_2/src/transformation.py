@@ -1,200 +1,299 @@
+import hashlib
+import json
 import logging
+import os
+import sys
 import uuid
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from functools import lru_cache
 import re
+from utils.cache_utils import LookupCache
 
 
 LOGGER = logging.getLogger()
 
 LOGGER.setLevel(logging.INFO)
 
-# Generate UUIDs
-def generate_uuid():
-    return str(uuid.uuid4())
-
-# Remove PII, keep only relevant columns
-def remove_sensitive_info(rows):
-    cleaned_rows = [["datetime", "branch", "product", "total_price", "payment_method"]]
-    for row in rows:
-        if len(row) < 6:
-            continue
-        datetime_val, branch, _, product, total_price, payment_method, *_ = row
-        cleaned_rows.append([datetime_val, branch, product, total_price, payment_method])
-    return cleaned_rows
-
-# Parse products into structured dicts
-def parse_products(rows):
-    parsed_list = []
-    for row_num, row in enumerate(rows[1:], start=2):
-        products_str = row[2].strip()
-        if not products_str:
-            continue
-        product_items = [p.strip() for p in products_str.split(',')]
-        for p in product_items:
-            parts = [x.strip() for x in p.split(' - ')]
-            if len(parts) == 3:
-                type_size, flavour, price = parts
-            elif len(parts) == 2:
-                type_size, price = parts
-                flavour = None
-            else:
-                continue
-
-            match = re.match(r"(Regular|Large)\s+(.*)", type_size.title())
-            if match:
-                size, type_name = match.groups()
-            else:
-                size = None
-                type_name = type_size.title()
-
-            parsed_list.append({
-                "size": size,
-                "name": type_name,
-                "flavour": flavour.title() if flavour else None,
-                "price": float(price)
-            })
-    return parsed_list
-
-# Drop duplicates and reuse UUIDs from DB
+PRODUCT_SIZE_PATTERN = re.compile(r"(Regular|Large)\s+(.*)")
+
+# The menu only has a few dozen distinct item strings, this leaves plenty of headroom
+PRODUCT_PARSE_CACHE_SIZE = 1024
+
+ORDER_DATETIME_FORMAT = "%d/%m/%Y %H:%M"
+# A branch file covers one day, i.e. at most 1440 distinct minutes
+ORDER_DATETIME_CACHE_SIZE = 4096
+
+# How long a warm container trusts its product/branch id caches before re-reading the tables
+LOOKUP_CACHE_TTL_ENV_VAR_NAME = 'LOOKUP_CACHE_TTL_SECONDS'
+LOOKUP_CACHE_TTL_SECONDS = int(os.environ.get(LOOKUP_CACHE_TTL_ENV_VAR_NAME, '900'))
+
+# What transform_rows hands to the loader: one record per table row,
+# fields in the table's column order (the handler's TABLE_COLUMNS is built from them).
+# Tuples rather than dicts: much smaller per row, and the loader passes them to the driver
+# as the parameter tuple without copying the values out.
+ProductRow = namedtuple('ProductRow', ['product_id', 'name', 'size', 'flavour', 'price'])
+BranchRow = namedtuple('BranchRow', ['branch_id', 'branch_name'])
+OrderRow = namedtuple('OrderRow', ['order_id', 'branch_id', 'product_id', 'quantity', 'order_date', 'total_price',
+                                   'payment_method'])
+
+# Namespace for the name-based ids below. Never change it: ids already in the database are derived from it.
+ID_NAMESPACE = uuid.UUID('3a5b8a4f-5869-4b00-b8f7-10949b052290')
+
+# Same result as str(uuid.uuid5(ID_NAMESPACE, name)), without building a UUID object (hot path for orders)
+def _uuid5(name):
+    digest = bytearray(hashlib.sha1(ID_NAMESPACE.bytes + name.encode('utf-8')).digest()[:16])
+    digest[6] = (digest[6] & 0x0F) | 0x50
+    digest[8] = (digest[8] & 0x3F) | 0x80
+    hex_id = digest.hex()
+    return f'{hex_id[:8]}-{hex_id[8:12]}-{hex_id[12:16]}-{hex_id[16:20]}-{hex_id[20:]}'
+
+# Deterministic ids: the same key always gives the same UUIDv5, so any worker or re-run
+# computes the same id without asking the database. json.dumps keeps None and "" apart.
+def product_uuid(key):
+    name, size, flavour = key
+    return _uuid5(json.dumps(["product", name, size, flavour]))
+
+def branch_uuid(branch_name):
+    return _uuid5(json.dumps(["branch", branch_name]))
+
+# fields is everything the file says about the order (all strings, joined with the unit separator);
+# occurrence tells apart identical rows in one file
+def order_uuid(fields, occurrence=0):
+    return _uuid5("\x1f".join(("order", *fields, str(occurrence))))
+
+# Marks where the rows of the next source file start in a row stream that chains several files
+# (a batched event, see cuppa_chaos_etl_lambda.open_rows). Shorter than a branch file row, so the
+# transform loop only looks for it among the rows it would skip anyway. Stages that count the
+# rows of the stream count the markers too, one per file.
+SourceStart = namedtuple('SourceStart', ['name'])
+
+# (name, rows) per source file -> one row stream with a SourceStart before each file's rows
+def rows_by_source(sources):
+    for name, rows in sources:
+        yield SourceStart(name)
+        yield from rows
+
+# Hands out order ids for one source file: the first copy of a row gets order_uuid(fields),
+# an identical row later in the same file gets occurrence 1, 2, ...
+# Occurrences start again with every file, so a file loaded again (alone or batched with its
+# earlier copy) gets the ids it got the first time, and its inserts are no-ops.
+class OrderIds:
+
+    def __init__(self):
+        self._occurrences = {}
+
+    def start_source(self):
+        self._occurrences = {}
+
+    def next_id(self, fields):
+        base_id = order_uuid(fields)
+        occurrence = self._occurrences.get(base_id, 0)
+        self._occurrences[base_id] = occurrence + 1
+        return base_id if occurrence == 0 else order_uuid(fields, occurrence)
+
+# Parse one basket item like "Large Chai latte - 2.60" into (size, name, flavour, price)
+# Returns None for items that don't match the "<size> <name> [- <flavour>] - <price>" layout
+# Cached on the raw item string, so a repeated item is a dict lookup instead of a re-parse
+@lru_cache(maxsize=PRODUCT_PARSE_CACHE_SIZE)
+def parse_product_item(item):
+    parts = [x.strip() for x in item.split(' - ')]
+    if len(parts) == 3:
+        type_size, flavour, price = parts
+    elif len(parts) == 2:
+        type_size, price = parts
+        flavour = None
+    else:
+        return None
+
+    try:
+        price = float(price)
+    except ValueError:
+        return None
+
+    type_size = type_size.title()
+    match = PRODUCT_SIZE_PATTERN.match(type_size)
+    if match:
+        size, name = match.groups()
+    else:
+        size = None
+        name = type_size
+
+    # Interned: the same size, name and flavour come out of many distinct items (every size and price of a drink),
+    # so the product keys and records share one string each
+    return (sys.intern(size) if size else None, sys.intern(name),
+            sys.intern(flavour.title()) if flavour else None, price)
+
+def product_parse_cache_stats():
+    info = parse_product_item.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+# Parse an order timestamp in the fixed "dd/mm/YYYY HH:MM" layout by slicing the string
+# Anything that doesn't fit the layout goes through strptime, which raises ValueError if malformed
+# Cached per distinct minute, orders in the same minute share one datetime
+@lru_cache(maxsize=ORDER_DATETIME_CACHE_SIZE)
+def parse_order_datetime(datetime_str):
+    if (len(datetime_str) == 16 and datetime_str[2] == '/' and datetime_str[5] == '/'
+            and datetime_str[10] == ' ' and datetime_str[13] == ':'):
+        day, month, year = datetime_str[0:2], datetime_str[3:5], datetime_str[6:10]
+        hour, minute = datetime_str[11:13], datetime_str[14:16]
+        if (day + month + year + hour + minute).isdecimal():
+            try:
+                return datetime(int(year), int(month), int(day), int(hour), int(minute))
+            except ValueError:
+                pass  # e.g. 31/02, let strptime produce the error
+
+    return datetime.strptime(datetime_str, ORDER_DATETIME_FORMAT)
+
+# Ids already in the database, by product key
 def get_existing_products(cursor):
     cursor.execute("SELECT product_id, name, size, flavour FROM products")
     return { (row[1], row[2], row[3]): row[0] for row in cursor.fetchall() }
 
-def drop_duplicate_product_values(parsed_list, cursor):
-    seen = get_existing_products(cursor)
-    unique_rows = []
-    for row in parsed_list:
-        key = (row['name'], row['size'], row['flavour'])
-        if key in seen:
-            row['product_id'] = seen[key]
-        else:
-            row['product_id'] = generate_uuid()
-            seen[key] = row['product_id']
-            unique_rows.append(row)
-    return unique_rows
-
-# Normalize branches, reuse UUIDs from DB
+# Single key lookup, used to top up the warm cache. Written without IS NOT DISTINCT FROM for Redshift.
+def get_existing_product_id(cursor, key):
+    name, size, flavour = key
+    cursor.execute("""
+        SELECT product_id FROM products
+        WHERE name = %s
+        AND (size = %s OR (size IS NULL AND %s IS NULL))
+        AND (flavour = %s OR (flavour IS NULL AND %s IS NULL))
+    """, (name, size, size, flavour, flavour))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+# Ids already in the database, by branch name
 def get_existing_branches(cursor):
     cursor.execute("SELECT branch_id, branch_name FROM branches")
     return { row[1]: row[0] for row in cursor.fetchall() }
 
-def normalize_branches(rows, cursor):
-    branch_list = []
-    seen = get_existing_branches(cursor)
-    for row in rows[1:]:
-        branch_name = row[1]
-        if branch_name not in seen:
-            branch_id = generate_uuid()
-            seen[branch_name] = branch_id
-            branch_list.append({"branch_id": branch_id, "branch_name": branch_name})
-    return branch_list
-
-# Normalize orders
-def normalize_orders(rows, products_table, branches_table):
-    normalised_orders = []
-
-    product_lookup = {(p['name'], p['size'], p['flavour']): p['product_id'] for p in products_table}
-    branch_lookup = {b['branch_name']: b['branch_id'] for b in branches_table}
-
-    for row in rows[1:]:
-        datetime_str, branch_name, products_str, total_price, payment_method = row
-        if not datetime_str or not products_str:
-            continue
-
-        try:
-            order_date = datetime.strptime(datetime_str, "%d/%m/%Y %H:%M")
-        except ValueError:
-            continue
-
-        branch_id = branch_lookup.get(branch_name)
-        if not branch_id:
-            continue
-
-        product_items = [p.strip() for p in products_str.split(',')]
-        quantity_counter = defaultdict(int)
-        product_prices = {}
-
-        for p in product_items:
-            parts = [x.strip() for x in p.split(' - ')]
-            if len(parts) == 3:
-                type_size, flavour, price = parts
-            elif len(parts) == 2:
-                type_size, price = parts
-                flavour = None
-            else:
+def get_existing_branch_id(cursor, branch_name):
+    cursor.execute("SELECT branch_id FROM branches WHERE branch_name = %s", (branch_name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+PRODUCT_ID_CACHE = LookupCache("products", LOOKUP_CACHE_TTL_SECONDS, get_existing_products, get_existing_product_id)
+BRANCH_ID_CACHE = LookupCache("branches", LOOKUP_CACHE_TTL_SECONDS, get_existing_branches, get_existing_branch_id)
+
+# Call after the transformed data is committed, so the next warm invocation knows the new ids
+def remember_loaded(transformed_data):
+    PRODUCT_ID_CACHE.remember({(p.name, p.size, p.flavour): p.product_id for p in transformed_data["products"]})
+    BRANCH_ID_CACHE.remember({b.branch_name: b.branch_id for b in transformed_data["branches"]})
+
+# Call when a load fails, the DB may not match what the caches think
+def invalidate_lookup_caches():
+    PRODUCT_ID_CACHE.invalidate()
+    BRANCH_ID_CACHE.invalidate()
+
+# Single pass over the raw rows: drop PII, parse the basket, resolve product and
+# branch IDs and emit order lines for each row in one go, instead of separate
+# PII / parse / dedup / normalize passes re-parsing every item (benchmarks/bench_transformation.py).
+# New products, branches and orders get deterministic ids (product_uuid etc.), so re-running a file
+# produces the same rows and the ON CONFLICT inserts skip them.
+# cursor: reuse ids already in the database (e.g. older uuid4 rows) through the lookup caches.
+# Pass None to skip the database entirely; every product and branch in the file is then returned
+# and left to ON CONFLICT DO NOTHING.
+# As an object so the rows can also be fed in chunks (see pipeline.py): ids and order occurrences
+# carry over between calls, so the chunks' outputs put together are what one call over all rows gives.
+class RowTransformer:
+
+    def __init__(self, cursor=None):
+        # Ids minted in this run only go into the shared caches with remember_loaded() after the commit
+        self.cursor = cursor
+        if cursor is None:
+            self.product_cache = self.branch_cache = None
+            self.product_ids = {}
+            self.branch_ids = {}
+        else:
+            self.product_cache = PRODUCT_ID_CACHE.begin(cursor)
+            self.branch_cache = BRANCH_ID_CACHE.begin(cursor)
+            self.product_ids = self.product_cache.snapshot()
+            self.branch_ids = self.branch_cache.snapshot()
+        self.order_ids = OrderIds()
+
+    # Products and branches first seen in these rows, and the rows' order lines
+    def transform(self, rows):
+        cursor = self.cursor
+        product_cache, branch_cache = self.product_cache, self.branch_cache
+        product_ids, branch_ids, order_ids = self.product_ids, self.branch_ids, self.order_ids
+
+        products_table = []
+        branches_table = []
+        orders_table = []
+
+        for row in rows:
+            if len(row) < 6:
+                if row.__class__ is SourceStart:
+                    order_ids.start_source()
                 continue
-
-            match = re.match(r"(Regular|Large)\s+(.*)", type_size.title())
-            if match:
-                size, name = match.groups()
-            else:
-                size = None
-                name = type_size.title()
-
-            key = (name, size, flavour.title() if flavour else None)
-            product_id = product_lookup.get(key)
-            if not product_id:
+            # Column 2 is the customer name and the card number follows payment_method: never read them
+            datetime_str, branch_name, _, products_str, total_price, payment_method = row[:6]
+
+            branch_id = branch_ids.get(branch_name)
+            if branch_id is None:
+                if branch_cache is not None:
+                    branch_id = branch_cache.get(branch_name, cursor)
+                if branch_id is None:
+                    branch_id = branch_uuid(branch_name)
+                    branches_table.append(BranchRow(branch_id, branch_name))
+                branch_ids[branch_name] = branch_id
+
+            products_str = products_str.strip()
+            if not products_str:
                 continue
 
-            quantity_counter[product_id] += 1
-            product_prices[product_id] = (price)
-
-        order_id = generate_uuid()
-        for product_id, qty in quantity_counter.items():
-            normalised_orders.append({
-                "order_id": order_id,
-                "branch_id": branch_id,
-                "product_id": product_id,
-                "quantity": qty,
-                "order_date": order_date,
-                "total_price": product_prices[product_id] * qty,
-                "payment_method": payment_method
-            })
-
-    return normalised_orders
-
-def transformation(data, cursor):
-
-    LOGGER.info('Transformation stage: parsing products...')
-
-    LOGGER.info(f'Remove sensitive information: processing rows={len(data)}')
-
-    removed_pii = remove_sensitive_info(data)
-
-    LOGGER.info("Removed all sensitive information.")
-
-    LOGGER.info("Parsing: starting...")
-
-    parsed = parse_products(removed_pii)
-
-    LOGGER.info('Parsing products done.')
-
-    LOGGER.info('Dropping duplicate product values...')
-
-    LOGGER.info('Normalizing products...')
-
-    clean_products_table = drop_duplicate_product_values(parsed, cursor)
-
-    LOGGER.info('Product table normalised.')
+            quantity_counter = defaultdict(int)
+            product_prices = {}
+
+            for item in products_str.split(','):
+                parsed = parse_product_item(item)
+                if parsed is None:
+                    continue
+
+                size, name, flavour, price = parsed
+                key = (name, size, flavour)
+                product_id = product_ids.get(key)
+                if product_id is None:
+                    if product_cache is not None:
+                        product_id = product_cache.get(key, cursor)
+                    if product_id is None:
+                        product_id = product_uuid(key)
+                        products_table.append(ProductRow(product_id, name, size, flavour, price))
+                    product_ids[key] = product_id
+
+                quantity_counter[product_id] += 1
+                product_prices[product_id] = price
+
+            if not datetime_str:
+                continue
+            try:
+                order_date = parse_order_datetime(datetime_str)
+            except ValueError:
+                continue
 
-    LOGGER.info('Dropping duplicate branches...')
-    
-    LOGGER.info('Normalising branches...')
+            order_id = order_ids.next_id((branch_name, datetime_str, products_str, total_price, payment_method))
+            for product_id, qty in quantity_counter.items():
+                orders_table.append(OrderRow(order_id, branch_id, product_id, qty, order_date,
+                                             product_prices[product_id] * qty, payment_method))
 
-    clean_branch_table = normalize_branches(removed_pii, cursor)
+        return {
+            "products": products_table,
+            "branches": branches_table,
+            "orders": orders_table
+        }
 
-    LOGGER.info('Branches normalised.')
 
-    LOGGER.info('Orders normalised')
+def transform_rows(rows, cursor=None):
+    return RowTransformer(cursor).transform(rows)
 
-    clean_orders_table = normalize_orders(removed_pii, clean_products_table, clean_branch_table)
+def transformation(data, cursor=None):
 
+    LOGGER.info('Transformation stage: single pass over rows (remove PII, parse products, normalise)...')
 
-    return {
-    "products": clean_products_table,
-    "branches": clean_branch_table,
-    "orders": clean_orders_table
-}
+    # data may be a list or a row iterator from extract.extract_stream
+    transformed = transform_rows(data, cursor)
 
+    LOGGER.info(f'Transformation stage: done: products={len(transformed["products"])}, '
+                f'branches={len(transformed["branches"])}, orders={len(transformed["orders"])}')
 
+    return transformed
@@ -0,0 +1,100 @@
+# Caches kept at module scope so they survive between invocations on a warm Lambda container.
+# Nothing in here talks to AWS or the database directly, the loaders are passed in.
+
+import logging
+import time
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+
+# A key -> id map (e.g. product key -> product_id) backed by a DB table.
+# The first use, or the first use after the TTL runs out, loads the whole table with load_all.
+# After that only keys that aren't cached yet are looked up one by one with load_one,
+# so a warm invocation never re-scans the table.
+# Ids created during an invocation are only added with remember() once they are committed.
+class LookupCache:
+
+    def __init__(self, name, ttl_seconds, load_all, load_one, clock=time.monotonic):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self._load_all = load_all
+        self._load_one = load_one
+        self._clock = clock
+        self._values = {}
+        self._loaded_at = None
+        self._full_load_this_run = False
+        self._checked = set()
+        self.stats = {"full_loads": 0, "key_loads": 0}
+
+    def is_fresh(self):
+        return self._loaded_at is not None and (self._clock() - self._loaded_at) < self.ttl_seconds
+
+    # Call once per invocation before get()
+    def begin(self, cursor):
+        self._checked = set()
+        self._full_load_this_run = not self.is_fresh()
+        if self._full_load_this_run:
+            self._values = self._load_all(cursor)
+            self._loaded_at = self._clock()
+            self.stats["full_loads"] += 1
+            LOGGER.info(f'LookupCache: {self.name}: full load, keys={len(self._values)}')
+        else:
+            LOGGER.info(f'LookupCache: {self.name}: warm, keys={len(self._values)}')
+        return self
+
+    # Copy of the cached ids, for a hot loop to read without going through get()
+    def snapshot(self):
+        return dict(self._values)
+
+    def get(self, key, cursor):
+        value = self._values.get(key)
+        if value is not None:
+            return value
+
+        # Just did a full load, or already asked the DB this run: it isn't there
+        if self._full_load_this_run or key in self._checked:
+            return None
+
+        self._checked.add(key)
+        self.stats["key_loads"] += 1
+        value = self._load_one(cursor, key)
+        if value is not None:
+            self._values[key] = value
+        return value
+
+    def remember(self, items):
+        self._values.update(items)
+
+    def invalidate(self):
+        LOGGER.info(f'LookupCache: {self.name}: invalidated')
+        self._values = {}
+        self._loaded_at = None
+
+
+# Plain key -> value cache where every entry expires ttl_seconds after it was set
+class TTLCache:
+
+    def __init__(self, ttl_seconds, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if self._clock() >= expires_at:
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (value, self._clock() + self.ttl_seconds)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries = {}
+        else:
+            self._entries.pop(key, None)
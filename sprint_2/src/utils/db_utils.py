@@ -1,45 +1,209 @@
 # This file exists to separate the direct use of psycopg2 from functions that only
 # care about the Connection and Cursor - this makes those easier to unit test.
 
-import psycopg2 as psy
-import boto3
 import logging
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache_utils import TTLCache
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
-ssm_client = boto3.client('ssm')
+# Created on first use rather than at import, see get_ssm_client
+_ssm_client = None
+
+SSM_CACHE_TTL_ENV_VAR_NAME = 'SSM_CACHE_TTL_SECONDS'
+# Resolved connection details per parameter name, so warm invocations skip the SSM call
+_ssm_cache = TTLCache(int(os.environ.get(SSM_CACHE_TTL_ENV_VAR_NAME, '300')))
+
+# Kept at module scope so warm invocations skip the connect/TLS/auth handshake
+_connection = None
+_connection_key = None
+
+# Extra connections for loading tables concurrently (see concurrent_load.py), kept warm the same way
+_load_connections = []
+_load_connections_key = None
+
+
+# Stands in for the boto3 SSM client locally and in tests, see set_ssm_client
+# values maps parameter name -> dict of connection details
+class LocalSsmClient:
+
+    def __init__(self, values):
+        self.values = values
+        self.calls = 0
+
+    def get_parameter(self, Name):
+        self.calls += 1
+        return {'Parameter': {'Name': Name, 'Value': json.dumps(self.values[Name])}}
+
+
+# boto3 and psycopg2 are only imported when first needed, which keeps the Lambda cold start
+# (and importing this module in tests and benchmarks) cheap
+def get_ssm_client():
+    global _ssm_client
+    if _ssm_client is None:
+        import boto3
+        _ssm_client = boto3.client('ssm')
+    return _ssm_client
+
+
+def set_ssm_client(client):
+    global _ssm_client
+    _ssm_client = client
+    _ssm_cache.invalidate()
+
+
+def get_psycopg2():
+    import psycopg2
+    return psycopg2
 
 
 # Get the SSM Param from AWS and turn it into JSON
+# Cached for SSM_CACHE_TTL_SECONDS, force_refresh=True skips the cache (e.g. password rotated)
 # Don't log the password!
-def get_ssm_param(param_name):
+def get_ssm_param(param_name, force_refresh=False):
+    if not force_refresh:
+        redshift_details = _ssm_cache.get(param_name)
+        if redshift_details is not None:
+            LOGGER.info(f'get_ssm_param: using cached param_name={param_name}')
+            return redshift_details
+
     LOGGER.info(f'get_ssm_param: getting param_name={param_name}')
-    parameter_details = ssm_client.get_parameter(Name=param_name)
+    parameter_details = get_ssm_client().get_parameter(Name=param_name)
     redshift_details = json.loads(parameter_details['Parameter']['Value'])
 
     host = redshift_details['host']
     user = redshift_details['user']
     db = redshift_details['database-name']
     LOGGER.info(f'get_ssm_param: loaded for db={db}, user={user}, host={host}')
+    _ssm_cache.set(param_name, redshift_details)
     return redshift_details
 
 
 # Use the redshift details json to connect
+def open_sql_database_connection(redshift_details):
+    LOGGER.info('open_sql_database_connection: opening connection...')
+    return get_psycopg2().connect(
+        host=redshift_details['host'],
+        database=redshift_details['database-name'],
+        user=redshift_details['user'],
+        password=redshift_details['password'],
+        port=redshift_details['port'],
+    )
+
+
 def open_sql_database_connection_and_cursor(redshift_details):
     try:
-        LOGGER.info('open_sql_database_connection_and_cursor: opening connection...')
-        db_connection = psy.connect(
-            host=redshift_details['host'],
-            database=redshift_details['database-name'],
-            user=redshift_details['user'],
-            password=redshift_details['password'],
-            port=redshift_details['port'],
-        )
+        db_connection = open_sql_database_connection(redshift_details)
         cursor = db_connection.cursor()
         LOGGER.info('open_sql_database_connection_and_cursor: connection ready')
         return db_connection, cursor
     except ConnectionError as ex:
         LOGGER.info(f'open_sql_database_connection_and_cursor: failed to open connection: {ex}')
         raise ex
+
+
+# Cheap round trip to check a reused connection is still alive (e.g. not dropped by an idle timeout)
+def is_connection_healthy(connection):
+    if connection is None or connection.closed:
+        return False
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+        cursor.close()
+        # Don't leave the health check's transaction open
+        connection.rollback()
+        return True
+    except get_psycopg2().Error as ex:
+        LOGGER.info(f'is_connection_healthy: connection is unusable: {ex}')
+        return False
+
+
+# Reuse the module level connection if it is healthy and for the same database, otherwise reconnect.
+# Hands out a new cursor each time; callers close the cursor but not the connection.
+def get_connection_key(redshift_details):
+    return (redshift_details['host'], redshift_details['port'],
+            redshift_details['database-name'], redshift_details['user'])
+
+
+def get_connection_and_cursor(redshift_details):
+    global _connection, _connection_key
+
+    key = get_connection_key(redshift_details)
+
+    if key == _connection_key and is_connection_healthy(_connection):
+        LOGGER.info('get_connection_and_cursor: reusing warm connection')
+    else:
+        discard_connection()
+        _connection = open_sql_database_connection(redshift_details)
+        LOGGER.info('get_connection_and_cursor: connection ready')
+        _connection_key = key
+
+    return _connection, _connection.cursor()
+
+
+# Drop the module level connection, e.g. after a failed invocation left it in an unknown state
+def discard_connection():
+    global _connection, _connection_key
+
+    if _connection is not None and not _connection.closed:
+        try:
+            _connection.close()
+        except get_psycopg2().Error as ex:
+            LOGGER.info(f'discard_connection: error closing connection: {ex}')
+    _connection = None
+    _connection_key = None
+
+
+# count connections for concurrent loads, separate from the handler's own connection.
+# Healthy warm ones are reused, missing ones are opened in parallel (one handshake of wait, not count).
+def get_load_connections(redshift_details, count):
+    global _load_connections, _load_connections_key
+
+    key = get_connection_key(redshift_details)
+    if key != _load_connections_key:
+        discard_load_connections()
+        _load_connections_key = key
+
+    _load_connections = [connection for connection in _load_connections if is_connection_healthy(connection)]
+    missing = count - len(_load_connections)
+    if missing > 0:
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            _load_connections.extend(executor.map(lambda _: open_sql_database_connection(redshift_details),
+                                                  range(missing)))
+        LOGGER.info(f'get_load_connections: opened {missing} connections, reusing {count - missing}')
+    return _load_connections[:count]
+
+
+def discard_load_connections():
+    global _load_connections, _load_connections_key
+
+    for connection in _load_connections:
+        if not connection.closed:
+            try:
+                connection.close()
+            except get_psycopg2().Error as ex:
+                LOGGER.info(f'discard_load_connections: error closing connection: {ex}')
+    _load_connections = []
+    _load_connections_key = None
+
+
+def is_auth_failure(ex):
+    return 'authentication failed' in str(ex).lower()
+
+
+# Resolve the connection details from SSM (cached) and connect.
+# If the cached details are rejected by the database, re-read the parameter once and retry.
+def get_connection_and_cursor_from_ssm(param_name):
+    redshift_details = get_ssm_param(param_name)
+    try:
+        return get_connection_and_cursor(redshift_details)
+    except get_psycopg2().OperationalError as ex:
+        if not is_auth_failure(ex):
+            raise
+        LOGGER.info('get_connection_and_cursor_from_ssm: authentication failed, refreshing ssm param')
+        redshift_details = get_ssm_param(param_name, force_refresh=True)
+        return get_connection_and_cursor(redshift_details)
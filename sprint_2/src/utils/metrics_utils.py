@@ -0,0 +1,159 @@
+# Per-stage timing and memory metrics for the pipeline, written to stdout as CloudWatch
+# Embedded Metric Format (EMF) documents. On Lambda, stdout goes to CloudWatch Logs, which turns
+# each document into metrics (namespace CuppaChaos/ETL, dimension Stage) without an API call.
+# The same JSON lines can be scraped from the logs by anything else (e.g. Grafana / Loki).
+
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CuppaChaos/ETL')
+# tracemalloc gives the Python heap peak per stage, but slows allocation-heavy code down noticeably
+METRICS_TRACEMALLOC = os.environ.get('METRICS_TRACEMALLOC', 'false').lower() == 'true'
+
+METRIC_UNITS = {
+    "WallTime": "Milliseconds",
+    "CpuTime": "Milliseconds",
+    "RowsIn": "Count",
+    "RowsOut": "Count",
+    "RssIncrease": "Megabytes",
+    "ProcessPeakRss": "Megabytes",
+    "PeakHeap": "Megabytes",
+}
+
+
+# ru_maxrss is kilobytes on Linux and bytes on macOS. It's the peak for the whole process
+# (the whole container on a warm Lambda), so it only goes up between stages. Emitted as ProcessPeakRss;
+# what a stage itself added is RssIncrease, the rise of that peak while the stage ran
+# (0 when the stage stayed under a peak reached before it, e.g. by an earlier invocation).
+def peak_rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+# What one stage measured. rows_in / rows_out are filled in by the caller when they are known.
+class StageMetrics:
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self.peak_rss_mb = None
+        # Only set where the stage ran on its own (not for timed_iter or pipeline stages,
+        # which interleave with other work)
+        self.rss_increase_mb = None
+        self.peak_heap_mb = None
+
+    def values(self):
+        values = {
+            "WallTime": round(self.wall_ms, 3),
+            "CpuTime": round(self.cpu_ms, 3),
+            "RowsIn": self.rows_in,
+            "RowsOut": self.rows_out,
+            "RssIncrease": None if self.rss_increase_mb is None else round(self.rss_increase_mb, 3),
+            "ProcessPeakRss": None if self.peak_rss_mb is None else round(self.peak_rss_mb, 3),
+            "PeakHeap": None if self.peak_heap_mb is None else round(self.peak_heap_mb, 3),
+        }
+        return {name: value for name, value in values.items() if value is not None}
+
+
+# One per invocation. properties are added to every document as plain fields (file names etc.),
+# they are searchable in the logs but are not dimensions, so they don't multiply the metric count.
+class PipelineMetrics:
+
+    def __init__(self, namespace=METRICS_NAMESPACE, properties=None, trace_memory=METRICS_TRACEMALLOC,
+                 emit=print, clock=time.perf_counter, cpu_clock=time.process_time):
+        self.namespace = namespace
+        self.properties = dict(properties or {})
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._emit = emit
+        self._clock = clock
+        self._cpu_clock = cpu_clock
+
+    # with metrics.stage('load_orders', rows_in=len(orders)) as stage: ...; stage.rows_out = n
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        stage = StageMetrics(name, rows_in)
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        start_peak_rss = peak_rss_mb()
+        start_wall, start_cpu = self._clock(), self._cpu_clock()
+        try:
+            yield stage
+        finally:
+            stage.wall_ms = (self._clock() - start_wall) * 1000
+            stage.cpu_ms = (self._cpu_clock() - start_cpu) * 1000
+            stage.peak_rss_mb = peak_rss_mb()
+            stage.rss_increase_mb = stage.peak_rss_mb - start_peak_rss
+            if self.trace_memory:
+                stage.peak_heap_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                if tracing:
+                    tracemalloc.stop()
+            self.record(stage)
+
+    # Times a lazy stage (e.g. streamed extract) by the time spent producing each item,
+    # so the consumer's own work isn't counted. Recorded once the iterable is used up.
+    def timed_iter(self, name, iterable):
+        stage = StageMetrics(name)
+        stage.rows_out = 0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start_wall, start_cpu = self._clock(), self._cpu_clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    stage.wall_ms += (self._clock() - start_wall) * 1000
+                    stage.cpu_ms += (self._cpu_clock() - start_cpu) * 1000
+                stage.rows_out += 1
+                yield item
+        finally:
+            stage.peak_rss_mb = peak_rss_mb()
+            self.record(stage)
+
+    def record(self, stage):
+        self.stages.append(stage)
+        self._emit(json.dumps(self.to_emf(stage), default=str))
+
+    # Counts that belong to no timed stage (e.g. prepared statement use), one document under Stage=name
+    def record_counts(self, name, counts):
+        self._emit(json.dumps(self.to_emf_values(name, counts), default=str))
+
+    def to_emf(self, stage):
+        return self.to_emf_values(stage.name, stage.values())
+
+    def to_emf_values(self, stage_name, values):
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["Stage"]],
+                    "Metrics": [{"Name": name, "Unit": METRIC_UNITS.get(name, "Count")} for name in values],
+                }],
+            },
+            "Stage": stage_name,
+        }
+        document.update(self.properties)
+        document.update(values)
+        return document
+
+    # One line per stage for the regular logs
+    def summary(self):
+        return ', '.join(f'{stage.name}={stage.wall_ms:.1f}ms' for stage in self.stages)
@@ -1,25 +1,119 @@
-import boto3
+import codecs
+import json
 import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
-s3_client = boto3.client('s3')
+# Created on first use rather than at import, see get_s3_client
+_s3_client = None
+_s3_client_lock = threading.Lock()
 
+STREAM_CHUNK_SIZE = 64 * 1024
+FETCH_MAX_WORKERS = 8
 
-def get_file_info(event):
-    LOGGER.info('Get file info: starting')
-    first_record = event['Records'][0]
-    bucket_name = first_record['s3']['bucket']['name']
-    file_name = first_record['s3']['object']['key']
 
-    LOGGER.info(f'Get file info: file={file_name}, bucket_name={bucket_name}')
-    return bucket_name, file_name
+# boto3 is only imported and the client only built when S3 is first called, which keeps
+# the Lambda cold start (and importing this module in tests and benchmarks) cheap.
+# Locked because the first call can come from the load_files thread pool, and creating
+# clients on boto3's default session isn't thread safe.
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                _s3_client = boto3.client('s3')
+    return _s3_client
+
+
+# Swap in another client (e.g. a stub in tests)
+def set_s3_client(client):
+    global _s3_client
+    _s3_client = client
+
+
+# etag is None when the event didn't carry one, see add_missing_etags
+S3File = namedtuple('S3File', ['bucket_name', 'key', 'etag'])
+
+
+# Every S3File in the event, not just the first record.
+# Handles S3 notifications and SQS messages wrapping S3 notifications.
+# Keys arrive URL encoded in S3 events (e.g. spaces as '+').
+def get_files_info(event):
+    files = []
+    for record in event.get('Records', []):
+        if 's3' in record:
+            bucket_name = record['s3']['bucket']['name']
+            file_name = unquote_plus(record['s3']['object']['key'])
+            files.append(S3File(bucket_name, file_name, record['s3']['object'].get('eTag')))
+        elif 'body' in record:
+            files.extend(get_files_info(json.loads(record['body'])))
+        else:
+            LOGGER.warning(f'Get files info: skipping unrecognised record={record}')
+
+    LOGGER.info(f'Get files info: files={len(files)}')
+    return files
+
+# The ETag identifies the object's content, fetch it with a HEAD request where the event had none.
+# The HEAD requests run concurrently, like the downloads in load_files.
+def add_missing_etags(files, max_workers=FETCH_MAX_WORKERS):
+    missing = list(dict.fromkeys(file for file in files if not file.etag))
+    if not missing:
+        return list(files)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as executor:
+        etags = dict(zip(missing, executor.map(lambda file: get_etag(file.bucket_name, file.key), missing)))
+    return [file if file.etag else file._replace(etag=etags[file]) for file in files]
+
+def get_etag(bucket_name, s3_key):
+    response = get_s3_client().head_object(Bucket=bucket_name, Key=s3_key)
+    return response['ETag'].strip('"')
 
 def load_file(bucket_name, s3_key):
     LOGGER.info(f'Load file: loading s3_key={s3_key} from bucket_name={bucket_name}')
-    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+    response = get_s3_client().get_object(Bucket=bucket_name, Key=s3_key)
     body_text = response['Body'].read().decode('utf-8')
 
     LOGGER.info(f'Load file: done: s3_key={s3_key} result_chars={len(body_text)}')
-    return body_text
\ No newline at end of file
+    return body_text
+
+
+# Stream the object as decoded text lines instead of one big string.
+# Chunks are decoded incrementally so a multi-byte character split across
+# two chunks is still decoded correctly; only one chunk is held at a time.
+def stream_file(bucket_name, s3_key, chunk_size=STREAM_CHUNK_SIZE):
+    LOGGER.info(f'Stream file: streaming s3_key={s3_key} from bucket_name={bucket_name}')
+    response = get_s3_client().get_object(Bucket=bucket_name, Key=s3_key)
+    return iter_text_lines(response['Body'].iter_chunks(chunk_size))
+
+
+def iter_text_lines(byte_chunks, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in byte_chunks:
+        # The last piece may be an incomplete line, keep it for the next chunk
+        *lines, pending = (pending + decoder.decode(chunk)).split('\n')
+        for line in lines:
+            yield line + '\n'
+
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+# Fetch several objects at once on a thread pool (boto3 clients are thread safe).
+# Results come back in the same order as files.
+def load_files(files, max_workers=FETCH_MAX_WORKERS):
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as executor:
+        return list(executor.map(lambda file: load_file(file.bucket_name, file.key), files))
+
+
+# Same as load_files for streaming: the get_object requests run concurrently,
+# the bodies are then read lazily one after another by whoever iterates the lines.
+def stream_files(files, max_workers=FETCH_MAX_WORKERS):
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as executor:
+        return list(executor.map(lambda file: stream_file(file.bucket_name, file.key), files))
@@ -0,0 +1,106 @@
+# Applies the versioned SQL files in src/migrations, so the tables are only created or changed
+# when the database is behind, instead of running DDL on every file.
+# Like sql_utils this only needs a Connection and Cursor.
+
+import logging
+import os
+import re
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MIGRATION_FILE_PATTERN = re.compile(r"V(\d+)__(\w+)\.sql$")
+# For databases set up by the old create_db_tables, see the file's header
+LEGACY_UPGRADE_PATH = os.path.join(MIGRATIONS_DIR, 'legacy', 'upgrade_create_db_tables.sql')
+
+# Highest version this container has confirmed in the database, so warm invocations skip the check
+_confirmed_version = None
+
+
+# [(version, name, path)] sorted by version
+def list_migrations(migrations_dir=MIGRATIONS_DIR):
+    migrations = []
+    for file_name in os.listdir(migrations_dir):
+        match = MIGRATION_FILE_PATTERN.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(migrations_dir, file_name)))
+    return sorted(migrations)
+
+
+# 0 for a database that has never been migrated
+def get_schema_version(cursor):
+    cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'schema_version'")
+    if cursor.fetchone()[0] == 0:
+        return 0
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    return cursor.fetchone()[0] or 0
+
+
+# Tables from the old create_db_tables have orders.order_time where V001 has order_date
+def has_legacy_tables(cursor):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_name = 'orders' AND column_name = 'order_time'
+    """)
+    return cursor.fetchone()[0] > 0
+
+
+def upgrade_legacy_tables(connection, cursor):
+    LOGGER.info('upgrade_legacy_tables: tables from create_db_tables found, upgrading')
+    try:
+        with open(LEGACY_UPGRADE_PATH, encoding='utf-8') as f:
+            cursor.execute(f.read())
+        connection.commit()
+    except Exception:
+        # Another invocation may have upgraded them at the same time
+        connection.rollback()
+        if has_legacy_tables(cursor):
+            raise
+        LOGGER.info('upgrade_legacy_tables: upgraded concurrently')
+
+
+def apply_migration(connection, cursor, version, name, path):
+    LOGGER.info(f'apply_migration: applying version={version}, name={name}')
+    with open(path, encoding='utf-8') as f:
+        cursor.execute(f.read())
+    connection.commit()
+
+
+def ensure_schema(connection, cursor, migrations_dir=MIGRATIONS_DIR):
+    global _confirmed_version
+
+    migrations = list_migrations(migrations_dir)
+    latest_version = migrations[-1][0] if migrations else 0
+    if _confirmed_version is not None and _confirmed_version >= latest_version:
+        return _confirmed_version
+
+    LOGGER.info('ensure_schema: checking schema version')
+    try:
+        current_version = get_schema_version(cursor)
+        # Checked on every cold start, not only when versions are missing: a legacy database may
+        # already have version 1 recorded, V001 leaves existing tables as they are
+        if has_legacy_tables(cursor):
+            upgrade_legacy_tables(connection, cursor)
+        for version, name, path in migrations:
+            if version <= current_version:
+                continue
+            try:
+                apply_migration(connection, cursor, version, name, path)
+            except Exception:
+                # Another invocation may have applied it at the same time (duplicate schema_version row)
+                connection.rollback()
+                if get_schema_version(cursor) < version:
+                    raise
+                LOGGER.info(f'ensure_schema: version={version} was applied concurrently')
+            current_version = version
+        # End the read-only transaction left by the version check
+        connection.commit()
+    except Exception as ex:
+        LOGGER.info(f'ensure_schema: failed to migrate: {ex}')
+        connection.rollback()
+        raise
+
+    LOGGER.info(f'ensure_schema: schema at version={current_version}')
+    _confirmed_version = current_version
+    return current_version
@@ -1,63 +1,72 @@
+import io
+import itertools
 import uuid
 import logging
+import threading
+import weakref
+import zlib
+from datetime import datetime, timezone
+from utils import schema_utils
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
 
+# The table definitions live in src/migrations, see schema_utils
 def create_db_tables(connection, cursor):
     LOGGER.info('create_db_tables: started')
-    try:
+    schema_utils.ensure_schema(connection, cursor)
+    LOGGER.info('create_db_tables: done')
+
+
+LOAD_MODES = ("row", "batch", "staged", "prepared")
+
+PK_MAP = {"branches": "branch_id", "products": "product_id", "orders": "order_id, product_id"}
+
+
+# Parameter values per row, in column order. Records whose fields are exactly the columns
+# (transformation.ProductRow etc.) already are that and are used as they are;
+# dict rows get a list built per row.
+def row_values(data: list, columns: list):
+    if data and getattr(data[0], "_fields", None) == tuple(columns):
+        return data
+    return ([row[col] for col in columns] for row in data)
+
+
+# Build one INSERT with a VALUES group per row, so a whole batch is a single round trip.
+# Keeps the same ON CONFLICT ... DO NOTHING semantics as the row-by-row insert.
+def build_multi_row_insert(table: str, columns: list, row_count: int):
+    col_list_sql = ", ".join(columns)
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    values_sql = ",\n        ".join([placeholders] * row_count)
+
+    return f"""
+        INSERT INTO {table} ({col_list_sql})
+        VALUES {values_sql}
+        ON CONFLICT ({PK_MAP[table]}) DO NOTHING
+    """
 
-        LOGGER.info('create_db_tables: creating products, branches and orders table')
-
-        create_products_table ='''
-                        CREATE TABLE IF NOT EXISTS products (
-                        product_id VARCHAR(36) PRIMARY KEY,
-                        name VARCHAR(50) NOT NULL,
-                        size VARCHAR(50),
-                        flavour VARCHAR(50),
-                        price DECIMAL(10, 2) NOT NULL
-                        );'''
-        
-        create_branch_table = '''
-                            CREATE TABLE IF NOT EXISTS branches (
-                            branch_id VARCHAR(36) PRIMARY KEY,
-                            branch_name VARCHAR(20) NOT NULL
-                            );'''
-        
-        create_orders_table = '''
-                            CREATE TABLE IF NOT EXISTS orders (
-                            order_id VARCHAR(36) PRIMARY KEY,
-                            branch_id VARCHAR(36) NOT NULL,
-                            product_id VARCHAR(36) NOT NULL,
-                            quantity INT NOT NULL,
-                            order_time TIMESTAMP NOT NULL,
-                            total_price DECIMAL(10, 2) NOT NULL,
-                            payment_method VARCHAR(10) NOT NULL
-                            );'''        
-        cursor.execute(create_products_table)
-        cursor.execute(create_branch_table)
-        cursor.execute(create_orders_table)
-
-        LOGGER.info('create_db_tables: committing')
-        connection.commit()
-
-        LOGGER.info('create_db_tables: done')
-    except Exception as ex:
-        LOGGER.info(f'create_db_tables: failed to run sql: {ex}')
-        raise
-    
 
-def save_data_in_db(connection, cursor, table: str, data: list, columns: list, commit_every: int = 1000):
+# commit=False leaves the transaction open, so the caller can commit several tables
+# (and the processed_files ledger) atomically
+def save_data_in_db(connection, cursor, table: str, data: list, columns: list, commit_every: int = 1000,
+                    mode: str = "row", batch_size: int = 500, commit: bool = True):
     if not data:
         LOGGER.info('save_data_in_db: no rows to insert for table=%s', table)
         return
-    
+
+    if mode == "batch":
+        return save_data_in_db_batched(connection, cursor, table, data, columns, batch_size=batch_size, commit=commit)
+    if mode == "staged":
+        return save_data_in_db_staged(connection, cursor, table, data, columns, commit=commit)
+    if mode == "prepared":
+        return save_data_in_db_prepared(connection, cursor, table, data, columns, batch_size=batch_size, commit=commit)
+    if mode != "row":
+        raise ValueError(f"save_data_in_db: unknown mode={mode}, expected one of {LOAD_MODES}")
+
     col_list_sql = ", ".join(columns)
     placeholders = ", ".join(["%s"] * len(columns))
-    pk_map = {"branches": "branch_id", "products": "product_id", "orders": "order_id"}
-    pk_col = pk_map[table]
+    pk_col = PK_MAP[table]
 
     sql = f"""
         INSERT INTO {table} ({col_list_sql})
@@ -68,15 +77,15 @@ def save_data_in_db(connection, cursor, table: str, data: list, columns: list, c
     LOGGER.info("save_data_in_db: start tables=%s, rows=%d", table, len(data))
     try:
         count = 0
-        for row in data:
-            values = [row[col] for col in columns]
+        for values in row_values(data, columns):
             cursor.execute(sql, values)
             count += 1
-            if count % commit_every == 0:
+            if commit and count % commit_every == 0:
                 connection.commit()
                 LOGGER.info("save_data_in_db: committed batch of %d to %s", commit_every, table)
 
-        connection.commit()
+        if commit:
+            connection.commit()
         LOGGER.info("save_data_in_db: done table=%s, total_rows=%d", table, count)
 
     except Exception as ex:
@@ -84,3 +93,191 @@ def save_data_in_db(connection, cursor, table: str, data: list, columns: list, c
         LOGGER.error("save_data_in_db: errorrable=%s, ex=%s", table, ex)
         raise
 
+
+# Send rows in multi-row INSERT statements of batch_size rows each, then commit once.
+def save_data_in_db_batched(connection, cursor, table: str, data: list, columns: list, batch_size: int = 500,
+                            commit: bool = True):
+    if batch_size < 1:
+        raise ValueError(f"save_data_in_db_batched: batch_size must be positive, got {batch_size}")
+
+    LOGGER.info("save_data_in_db_batched: start table=%s, rows=%d, batch_size=%d", table, len(data), batch_size)
+
+    full_batch_sql = build_multi_row_insert(table, columns, batch_size)
+    try:
+        count = 0
+        for start in range(0, len(data), batch_size):
+            batch = data[start:start + batch_size]
+            sql = full_batch_sql if len(batch) == batch_size else build_multi_row_insert(table, columns, len(batch))
+            values = list(itertools.chain.from_iterable(row_values(batch, columns)))
+            cursor.execute(sql, values)
+            count += len(batch)
+
+        if commit:
+            connection.commit()
+        LOGGER.info("save_data_in_db_batched: done table=%s, total_rows=%d", table, count)
+
+    except Exception as ex:
+        connection.rollback()
+        LOGGER.error("save_data_in_db_batched: error table=%s, ex=%s", table, ex)
+        raise
+
+
+# One value in Postgres COPY text format: \N for NULL, backslash escapes for the separators
+def to_copy_text(value):
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+# Tab separated COPY text for the rows, built in memory in one pass
+def build_copy_buffer(data: list, columns: list):
+    buffer = io.StringIO()
+    for values in row_values(data, columns):
+        buffer.write("\t".join([to_copy_text(value) for value in values]))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+
+# Postgres only: COPY the rows into a temp table shaped like the target (no constraints, dropped
+# at commit), then move them across with one INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+# One COPY and one set-based statement per table instead of a statement per row or batch.
+# Redshift has no COPY FROM STDIN, use "batch" there.
+def save_data_in_db_staged(connection, cursor, table: str, data: list, columns: list, commit: bool = True):
+    LOGGER.info("save_data_in_db_staged: start table=%s, rows=%d", table, len(data))
+
+    stage_table = f"stage_{table}"
+    col_list_sql = ", ".join(columns)
+    try:
+        cursor.execute(f"CREATE TEMP TABLE {stage_table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        cursor.copy_expert(f"COPY {stage_table} ({col_list_sql}) FROM STDIN", build_copy_buffer(data, columns))
+        cursor.execute(f"""
+            INSERT INTO {table} ({col_list_sql})
+            SELECT {col_list_sql} FROM {stage_table}
+            ON CONFLICT ({PK_MAP[table]}) DO NOTHING
+        """)
+        inserted = cursor.rowcount
+        # Drop it now in case the transaction carries on to another load of the same table
+        cursor.execute(f"DROP TABLE {stage_table}")
+
+        if commit:
+            connection.commit()
+        LOGGER.info("save_data_in_db_staged: done table=%s, staged_rows=%d, inserted_rows=%s",
+                    table, len(data), inserted)
+
+    except Exception as ex:
+        connection.rollback()
+        LOGGER.error("save_data_in_db_staged: error table=%s, ex=%s", table, ex)
+        raise
+
+
+# Statement names prepared on each connection. The module level connections survive between warm
+# invocations, so the inserts are prepared once per container rather than once per run.
+# Weak keys: a discarded connection takes its entry with it.
+_prepared_statements = weakref.WeakKeyDictionary()
+
+# Running totals for the container, see prepared_statement_stats
+PREPARED_STATEMENT_STATS = {"checks": 0, "prepares": 0, "executes": 0}
+
+# concurrent_load runs prepared loads on several threads at once; += on a shared dict can lose counts
+_prepared_statements_lock = threading.Lock()
+
+
+def count_prepared_statements(name: str, count: int = 1):
+    with _prepared_statements_lock:
+        PREPARED_STATEMENT_STATS[name] += count
+
+
+def prepared_statement_stats():
+    with _prepared_statements_lock:
+        return dict(PREPARED_STATEMENT_STATS)
+
+
+# The columns are part of the name, so a different column list never runs an old statement
+def get_prepared_insert_name(table: str, columns: list):
+    return f"insert_{table}_{zlib.crc32(','.join(columns).encode('utf-8')):08x}"
+
+
+# PREPARE the table's insert on this connection unless it already is. The first time a connection
+# is seen (or after a failed load) the server is asked, since it is what really holds the statements.
+def ensure_prepared_insert(connection, cursor, table: str, columns: list):
+    name = get_prepared_insert_name(table, columns)
+    with _prepared_statements_lock:
+        prepared = _prepared_statements.setdefault(connection, set())
+    if name in prepared:
+        return name
+
+    count_prepared_statements("checks")
+    cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+    if cursor.fetchone() is None:
+        placeholders = ", ".join(f"${index}" for index in range(1, len(columns) + 1))
+        cursor.execute(f"""
+            PREPARE {name} AS
+            INSERT INTO {table} ({", ".join(columns)})
+            VALUES ({placeholders})
+            ON CONFLICT ({PK_MAP[table]}) DO NOTHING
+        """)
+        count_prepared_statements("prepares")
+        LOGGER.info("ensure_prepared_insert: prepared %s for table=%s", name, table)
+    prepared.add(name)
+    return name
+
+
+# The server parses and plans the insert once per connection (PREPARE), after that each row is a
+# short EXECUTE of it. batch_size EXECUTEs go in one round trip, like the batch mode's VALUES groups.
+def save_data_in_db_prepared(connection, cursor, table: str, data: list, columns: list, batch_size: int = 500,
+                             commit: bool = True):
+    if batch_size < 1:
+        raise ValueError(f"save_data_in_db_prepared: batch_size must be positive, got {batch_size}")
+
+    LOGGER.info("save_data_in_db_prepared: start table=%s, rows=%d, batch_size=%d", table, len(data), batch_size)
+
+    try:
+        name = ensure_prepared_insert(connection, cursor, table, columns)
+        execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(columns))})"
+        full_batch_sql = ";\n".join([execute_sql] * batch_size)
+        count = 0
+        for start in range(0, len(data), batch_size):
+            batch = data[start:start + batch_size]
+            sql = full_batch_sql if len(batch) == batch_size else ";\n".join([execute_sql] * len(batch))
+            cursor.execute(sql, list(itertools.chain.from_iterable(row_values(batch, columns))))
+            count += len(batch)
+            count_prepared_statements("executes", len(batch))
+
+        if commit:
+            connection.commit()
+        LOGGER.info("save_data_in_db_prepared: done table=%s, total_rows=%d", table, count)
+
+    except Exception as ex:
+        connection.rollback()
+        # Whether a PREPARE from the rolled back transaction survived is up to the server, ask it next time
+        with _prepared_statements_lock:
+            _prepared_statements.pop(connection, None)
+        LOGGER.error("save_data_in_db_prepared: error table=%s, ex=%s", table, ex)
+        raise
+
+
+# Files (anything with bucket_name, key and etag) already recorded in the processed_files ledger
+def get_processed_files(cursor, files):
+    if not files:
+        return set()
+    placeholders = ", ".join(["%s"] * len(files))
+    cursor.execute(f"""
+        SELECT bucket_name, file_key, etag FROM processed_files
+        WHERE file_key IN ({placeholders})
+    """, [file.key for file in files])
+    processed = set(cursor.fetchall())
+    return {file for file in files if (file.bucket_name, file.key, file.etag) in processed}
+
+
+# Call inside the load transaction, before the commit: if another invocation recorded the
+# same file first, the primary key makes this fail and the whole load rolls back
+def record_processed_files(cursor, files):
+    processed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    for file in files:
+        cursor.execute("""
+            INSERT INTO processed_files (bucket_name, file_key, etag, processed_at)
+            VALUES (%s, %s, %s, %s)
+        """, (file.bucket_name, file.key, file.etag, processed_at))
+    LOGGER.info("record_processed_files: recorded files=%d", len(files))
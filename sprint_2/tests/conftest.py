@@ -0,0 +1,32 @@
+import csv
+import glob
+import os
+import sys
+
+import pytest
+
+# The lambda code imports its modules flat from src/ (e.g. `from utils import sql_utils`),
+# so put src/ on the path the same way the Lambda runtime does.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import transformation  # noqa: E402
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sprint_1', 'data', '*.csv')
+
+
+@pytest.fixture(autouse=True)
+def cold_lookup_caches():
+    # Every test starts like a cold container
+    transformation.invalidate_lookup_caches()
+    yield
+    transformation.invalidate_lookup_caches()
+
+
+# The raw rows of the sprint_1 branch files, as extract returns them
+@pytest.fixture
+def sample_rows():
+    rows = []
+    for path in sorted(glob.glob(SAMPLE_DATA)):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows.extend(row for row in csv.reader(f) if row)
+    return rows
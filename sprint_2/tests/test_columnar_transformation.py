@@ -0,0 +1,80 @@
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+import transformation
+
+# The columnar engine is backfill only (sprint_1/backfill.py --engine columnar), pandas isn't a Lambda dependency
+pytest.importorskip('pandas')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sprint_1'))
+
+import columnar_transformation  # noqa: E402
+
+
+EDGE_ROWS = [
+    ["09/05/2023 09:00", "Leeds", "Jerome Soper", " Large Latte - 2.15 ,junk, Large Latte - 2.20", "4.35", "CARD", "1"],
+    ["09/05/2023 09:00", "Leeds", "Jerome Soper", "Large Latte - 2.15,junk,Large Latte - 2.20", "4.35", "CARD", "1"],
+    ["09/05/2023 09:00", "Leeds", "Ronald Moss", "junk", "0", "CASH", ""],  # an order without lines
+    ["31/02/2023 09:00", "York", "Joseph Mccabe", "Regular Tea - Green - 1.30", "1.3", "CASH", ""],
+    ["", "Derby", "Joseph Mccabe", "Large Mocha - 2.60", "2.6", "CARD", "2"],
+    ["09/05/2023 09:05", "Hull", "Joseph Mccabe", "   ", "0", "CASH", ""],
+    ["09/05/2023 09:06", "Leeds"],
+]
+
+
+def existing_ids_cursor():
+    cursor = MagicMock()
+    cursor.fetchall.side_effect = [
+        [("existing-product", "Iced Americano", "Regular", None)],
+        [("existing-branch", "Chesterfield")],
+    ]
+    return cursor
+
+# Happy Test
+
+def test_columnar_engine_gives_the_tables_of_transform_rows(sample_rows):
+    rows = sample_rows + EDGE_ROWS + [list(EDGE_ROWS[0])]
+
+    tables = columnar_transformation.transform_columns(rows)
+
+    assert columnar_transformation.to_records(tables) == transformation.transform_rows(rows)
+    assert [str(dtype) for dtype in tables["orders"].dtypes] == \
+        ["object", "object", "object", "int64", "datetime64[us]", "float64", "object"]
+
+
+def test_identical_rows_are_numbered_per_file_as_in_a_batched_event(sample_rows):
+    leeds = [row for row in sample_rows if row[1] == "Leeds"]
+    files = [("leeds.csv", leeds), ("leeds_2.csv", leeds + [list(leeds[0])]), ("rest.csv", sample_rows)]
+
+    expected = transformation.transform_rows(transformation.rows_by_source(files))
+
+    chained = columnar_transformation.transform_columns(transformation.rows_by_source(files))
+    assert columnar_transformation.to_records(chained) == expected
+    # One worker per file, put together afterwards (backfill.py)
+    per_file = columnar_transformation.concat_tables(
+        [columnar_transformation.transform_columns(rows) for _, rows in files])
+    assert columnar_transformation.to_records(per_file) == expected
+
+# Edge Case Test
+
+def test_ids_already_in_the_database_are_reused_like_transform_rows_does(sample_rows):
+    expected = transformation.transform_rows(sample_rows, existing_ids_cursor())
+    transformation.invalidate_lookup_caches()
+
+    looked_up = columnar_transformation.transform_columns(sample_rows, existing_ids_cursor())
+    # Transformed without a cursor (a backfill worker), existing ids put in afterwards
+    reused = columnar_transformation.reuse_existing_ids(
+        columnar_transformation.transform_columns(sample_rows),
+        {("Iced Americano", "Regular", None): "existing-product"}, {"Chesterfield": "existing-branch"})
+
+    assert columnar_transformation.to_records(looked_up) == expected
+    assert columnar_transformation.to_records(reused) == expected
+    assert "existing-product" in {order.product_id for order in expected["orders"]}
+
+
+def test_no_rows_give_empty_tables():
+    tables = columnar_transformation.transform_columns([["09/05/2023 09:06", "Leeds"]])
+
+    assert columnar_transformation.to_records(tables) == {"products": [], "branches": [], "orders": []}
@@ -0,0 +1,90 @@
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+import concurrent_load
+import transformation
+from cuppa_chaos_etl_lambda import TABLE_COLUMNS
+
+
+def make_tables(order_count):
+    orders = []
+    for i in range(order_count):
+        # Two lines per order
+        for product_id in ("p-1", "p-2"):
+            orders.append(transformation.OrderRow(f"order-{i}", "b-1", product_id, 1, datetime(2023, 5, 9, 9, 0),
+                                                  2.15, "CARD"))
+    return {
+        "products": [transformation.ProductRow("p-1", "Latte", "Large", None, 2.45),
+                     transformation.ProductRow("p-2", "Mocha", "Regular", None, 2.30)],
+        "branches": [transformation.BranchRow("b-1", "Leeds")],
+        "orders": orders,
+    }
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def save_data_in_db(connection, cursor, table, data, columns, mode, batch_size, commit):
+        with lock:
+            calls.append((connection, table, list(data), commit))
+
+    monkeypatch.setattr(concurrent_load.sql_utils, 'save_data_in_db', save_data_in_db)
+    return calls
+
+# Happy Test
+
+def test_every_line_of_an_order_goes_to_the_same_shard():
+    orders = make_tables(100)["orders"]
+
+    shards = concurrent_load.shard_rows(orders, 4)
+
+    assert sorted(row for shard in shards for row in shard) == sorted(orders)
+    assert all(shards)
+    for shard in shards:
+        for row in shard:
+            assert concurrent_load.shard_index(row.order_id, 4) == shards.index(shard)
+
+
+def test_dimensions_load_on_separate_connections_before_the_sharded_orders(loads):
+    connections = [MagicMock(name=f"connection-{i}") for i in range(3)]
+    tables = make_tables(50)
+
+    concurrent_load.load_concurrently(connections, tables, TABLE_COLUMNS, lambda table: "batch")
+
+    loaded_tables = [table for _, table, _, _ in loads]
+    assert loaded_tables[:2] in (["products", "branches"], ["branches", "products"])
+    assert loaded_tables[2:] == ["orders"] * 3
+    assert {loads[0][0], loads[1][0]} == {connections[0], connections[1]}
+    assert sorted(row for _, table, rows, _ in loads if table == "orders" for row in rows) == sorted(tables["orders"])
+    assert all(commit for _, _, _, commit in loads)
+
+
+def test_more_dimensions_than_connections_never_share_a_connection_at_once(loads):
+    connection = MagicMock()
+
+    concurrent_load.load_concurrently([connection], make_tables(5), TABLE_COLUMNS, lambda table: "row")
+
+    assert [table for _, table, _, _ in loads] == ["products", "branches", "orders"]
+
+# Unhappy Test
+
+def test_failed_shard_is_raised_after_the_other_shards_finish(monkeypatch):
+    finished = []
+
+    def save_data_in_db(connection, cursor, table, data, **kwargs):
+        if table == "orders" and connection.name == "failing":
+            raise RuntimeError("deadlock detected")
+        finished.append(table)
+
+    monkeypatch.setattr(concurrent_load.sql_utils, 'save_data_in_db', save_data_in_db)
+    connections = [MagicMock(), MagicMock(), MagicMock()]
+    connections[1].name = "failing"
+
+    with pytest.raises(RuntimeError, match="deadlock detected"):
+        concurrent_load.load_concurrently(connections, make_tables(50), TABLE_COLUMNS, lambda table: "batch")
+    assert sorted(finished) == ["branches", "orders", "orders", "products"]
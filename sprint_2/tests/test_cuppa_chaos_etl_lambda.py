@@ -0,0 +1,136 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import cuppa_chaos_etl_lambda
+import transformation
+from utils import db_utils, s3_utils, schema_utils, sql_utils
+from utils.s3_utils import S3File
+
+
+PARAM_NAME = 'cuppa_chaos_redshift_settings'
+DETAILS = {'host': 'localhost', 'port': 5432, 'database-name': 'cuppa', 'user': 'etl', 'password': 'secret'}
+
+
+CSV_BYTES = (
+    b'09/05/2023 09:00,Leeds,Jerome Soper,"Regular Iced americano - 2.15",2.15,CARD,7925280230207247\r\n'
+    b'09/05/2023 09:01,Leeds,Ronald Moss,"Large Chai latte - 2.60",2.6,CASH,\r\n'
+)
+
+
+@pytest.fixture
+def s3_client():
+    client = MagicMock()
+    client.get_object.side_effect = lambda Bucket, Key: {'Body': MagicMock(
+        read=lambda: CSV_BYTES, iter_chunks=lambda chunk_size: iter([CSV_BYTES]))}
+    s3_utils.set_s3_client(client)
+    yield client
+    s3_utils.set_s3_client(None)
+
+# The handler against the S3 and SSM stubs and a mock connection. Every commit and ledger write
+# is logged in events, in the order they happen.
+@pytest.fixture
+def handler_env(s3_client, monkeypatch):
+    monkeypatch.setenv('SSM_PARAMETER_NAME', PARAM_NAME)
+    monkeypatch.setenv('RECONCILE_EXISTING_IDS', 'false')
+    # Schema already confirmed by an earlier invocation
+    monkeypatch.setattr(schema_utils, '_confirmed_version', schema_utils.list_migrations()[-1][0])
+    db_utils.set_ssm_client(db_utils.LocalSsmClient({PARAM_NAME: DETAILS}))
+
+    events = []
+    connection = MagicMock(closed=0)
+    connection.commit.side_effect = lambda: events.append('commit')
+    ledger = connection.cursor.return_value.fetchall
+    ledger.return_value = []
+    record_processed_files = sql_utils.record_processed_files
+
+    def record(cursor, files):
+        events.append(('record', [file.key for file in files]))
+        record_processed_files(cursor, files)
+
+    monkeypatch.setattr(sql_utils, 'record_processed_files', record)
+    with patch.object(db_utils, 'open_sql_database_connection', return_value=connection):
+        yield connection, ledger, events
+    db_utils.discard_connection()
+
+
+def s3_event(*keys):
+    return {'Records': [{'s3': {'bucket': {'name': 'bucket'}, 'object': {'key': key, 'eTag': f'etag-{key}'}}}
+                        for key in keys]}
+
+# Happy Test
+
+def test_ledgered_files_are_skipped_before_any_download(handler_env, s3_client):
+    connection, ledger, events = handler_env
+    ledger.return_value = [('bucket', 'leeds.csv', 'etag-leeds.csv')]
+
+    cuppa_chaos_etl_lambda.lambda_handler(s3_event('leeds.csv'), None)
+
+    s3_client.get_object.assert_not_called()
+    assert events == []
+    connection.rollback.assert_called()
+
+
+def test_only_new_files_are_downloaded_and_recorded_in_the_same_commit(handler_env, s3_client):
+    connection, ledger, events = handler_env
+    ledger.return_value = [('bucket', 'leeds.csv', 'etag-leeds.csv')]
+
+    cuppa_chaos_etl_lambda.lambda_handler(s3_event('leeds.csv', 'york.csv'), None)
+
+    assert [call.kwargs['Key'] for call in s3_client.get_object.call_args_list] == ['york.csv']
+    # Tables and ledger rows go in one transaction: the ledger write, then the only commit
+    assert events == [('record', ['york.csv']), 'commit']
+    insert_tables = [call.args[0].split()[2] for call in connection.cursor.return_value.execute.call_args_list
+                     if call.args[0].lstrip().startswith('INSERT INTO')]
+    assert insert_tables == ['products', 'branches', 'orders', 'processed_files']
+
+
+@pytest.mark.parametrize('stream, stage_name', [(True, 'fetch_extract'), (False, 'extract')])
+def test_open_rows_times_the_s3_requests_in_the_fetch_stage(s3_client, stream, stage_name):
+    emitted = []
+    metrics = cuppa_chaos_etl_lambda.metrics_utils.PipelineMetrics(emit=emitted.append)
+    files = [S3File('bucket', 'leeds.csv', 'etag-1'), S3File('bucket', 'york.csv', 'etag-2')]
+
+    name, rows = cuppa_chaos_etl_lambda.open_rows(files, metrics, stream, max_workers=2)
+
+    # The objects are requested before any row is pulled, inside the fetch stage
+    assert s3_client.get_object.call_count == 2
+    assert [json.loads(document)["Stage"] for document in emitted] == ['fetch']
+    assert json.loads(emitted[0])["RowsOut"] == 2
+    assert name == stage_name
+    rows = list(rows)
+    assert [row for row in rows if isinstance(row, transformation.SourceStart)] == [
+        transformation.SourceStart('leeds.csv'), transformation.SourceStart('york.csv')]
+    assert [row[1] for row in rows if not isinstance(row, transformation.SourceStart)] == ['Leeds'] * 4
+
+
+def test_identical_files_in_one_batch_get_the_order_ids_of_one_file(s3_client):
+    metrics = cuppa_chaos_etl_lambda.metrics_utils.PipelineMetrics(emit=lambda document: None)
+    one_file = [S3File('bucket', 'leeds.csv', 'etag-1')]
+    two_files = one_file + [S3File('bucket', 'leeds_copy.csv', 'etag-1')]
+
+    alone = transformation.transform_rows(cuppa_chaos_etl_lambda.open_rows(one_file, metrics, True, 1)[1])
+    batched = transformation.transform_rows(cuppa_chaos_etl_lambda.open_rows(two_files, metrics, True, 2)[1])
+
+    assert {o.order_id for o in batched["orders"]} == {o.order_id for o in alone["orders"]}
+
+# Unhappy Test
+
+def test_failed_load_records_nothing_and_never_commits(handler_env, monkeypatch):
+    connection, _, events = handler_env
+    save_data_in_db = sql_utils.save_data_in_db
+
+    def failing_save(connection, cursor, table, **kwargs):
+        if table == 'orders':
+            raise RuntimeError('deadlock detected')
+        save_data_in_db(connection, cursor, table=table, **kwargs)
+
+    monkeypatch.setattr(sql_utils, 'save_data_in_db', failing_save)
+
+    with pytest.raises(RuntimeError, match='deadlock detected'):
+        cuppa_chaos_etl_lambda.lambda_handler(s3_event('york.csv'), None)
+
+    assert events == []
+    # The connection is dropped with its open transaction
+    connection.close.assert_called_once()
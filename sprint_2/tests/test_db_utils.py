@@ -0,0 +1,127 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytest.importorskip('psycopg2')
+from utils import db_utils  # noqa: E402
+
+
+PARAM_NAME = 'cuppa_chaos_redshift_settings'
+DETAILS = {'host': 'localhost', 'port': 5432, 'database-name': 'cuppa', 'user': 'etl', 'password': 'secret'}
+
+
+@pytest.fixture
+def local_ssm():
+    client = db_utils.LocalSsmClient({PARAM_NAME: DETAILS})
+    db_utils.set_ssm_client(client)
+    yield client
+    db_utils.discard_connection()
+
+# Happy Test
+
+def test_get_ssm_param_is_cached_until_forced(local_ssm):
+    assert db_utils.get_ssm_param(PARAM_NAME) == DETAILS
+    assert db_utils.get_ssm_param(PARAM_NAME) == DETAILS
+    assert local_ssm.calls == 1
+
+    db_utils.get_ssm_param(PARAM_NAME, force_refresh=True)
+    assert local_ssm.calls == 2
+
+def test_healthy_warm_connection_is_reused(local_ssm):
+    connection = MagicMock(closed=0)
+
+    with patch.object(db_utils, 'open_sql_database_connection', return_value=connection) as connect:
+        first, _ = db_utils.get_connection_and_cursor(DETAILS)
+        second, _ = db_utils.get_connection_and_cursor(DETAILS)
+
+    assert first is second is connection
+    connect.assert_called_once()
+    # The health check's own transaction is not left open
+    connection.rollback.assert_called_once()
+
+
+def test_changed_connection_details_open_a_new_connection(local_ssm):
+    old, new = MagicMock(closed=0), MagicMock(closed=0)
+
+    with patch.object(db_utils, 'open_sql_database_connection', side_effect=[old, new]):
+        db_utils.get_connection_and_cursor(DETAILS)
+        conn, _ = db_utils.get_connection_and_cursor({**DETAILS, 'host': 'replica'})
+
+    assert conn is new
+    old.close.assert_called_once()
+
+
+def test_discard_connection_closes_it_and_the_next_call_reconnects(local_ssm):
+    old, new = MagicMock(closed=0), MagicMock(closed=0)
+
+    with patch.object(db_utils, 'open_sql_database_connection', side_effect=[old, new]):
+        db_utils.get_connection_and_cursor(DETAILS)
+        db_utils.discard_connection()
+        conn, _ = db_utils.get_connection_and_cursor(DETAILS)
+
+    old.close.assert_called_once()
+    assert conn is new
+
+
+def test_load_connections_are_reused_while_healthy(local_ssm):
+    opened = [MagicMock(closed=0) for _ in range(3)]
+    try:
+        # Opened in parallel, so in no particular order
+        with patch.object(db_utils, 'open_sql_database_connection', side_effect=opened):
+            first = db_utils.get_load_connections(DETAILS, 2)
+            first[0].closed = 1
+            second = db_utils.get_load_connections(DETAILS, 2)
+
+        assert set(map(id, first)) == set(map(id, opened[:2]))
+        assert second == [first[1], opened[2]]
+    finally:
+        db_utils.discard_load_connections()
+    first[1].close.assert_called_once()
+
+# Unhappy Test
+
+def test_unhealthy_warm_connection_is_replaced(local_ssm):
+    dropped, new = MagicMock(closed=0), MagicMock(closed=0)
+    dropped.cursor.return_value.execute.side_effect = db_utils.get_psycopg2().OperationalError(
+        'server closed the connection unexpectedly')
+
+    with patch.object(db_utils, 'open_sql_database_connection', side_effect=[dropped, new]):
+        db_utils.get_connection_and_cursor(DETAILS)
+        conn, _ = db_utils.get_connection_and_cursor(DETAILS)
+
+    assert conn is new
+    dropped.close.assert_called_once()
+
+
+def test_closed_warm_connection_is_replaced_without_a_health_query(local_ssm):
+    closed, new = MagicMock(closed=0), MagicMock(closed=0)
+
+    with patch.object(db_utils, 'open_sql_database_connection', side_effect=[closed, new]):
+        db_utils.get_connection_and_cursor(DETAILS)
+        closed.closed = 1
+        closed.cursor.reset_mock()
+        conn, _ = db_utils.get_connection_and_cursor(DETAILS)
+
+    assert conn is new
+    closed.cursor.assert_not_called()
+
+
+def test_auth_failure_refreshes_the_ssm_param_and_retries(local_ssm):
+    db_utils.get_ssm_param(PARAM_NAME)
+    connection = MagicMock(closed=0)
+    auth_error = db_utils.get_psycopg2().OperationalError('FATAL: password authentication failed for user "etl"')
+
+    with patch.object(db_utils, 'open_sql_database_connection', side_effect=[auth_error, connection]):
+        conn, _ = db_utils.get_connection_and_cursor_from_ssm(PARAM_NAME)
+
+    assert conn is connection
+    assert local_ssm.calls == 2
+
+
+def test_other_connection_errors_are_not_retried(local_ssm):
+    with patch.object(db_utils, 'open_sql_database_connection',
+                      side_effect=db_utils.get_psycopg2().OperationalError('could not connect to server')):
+        with pytest.raises(db_utils.get_psycopg2().OperationalError):
+            db_utils.get_connection_and_cursor_from_ssm(PARAM_NAME)
+
+    assert local_ssm.calls == 1
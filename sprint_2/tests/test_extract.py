@@ -0,0 +1,91 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+from extract import extract, extract_stream
+from utils import s3_utils
+from utils.s3_utils import S3File, get_files_info, iter_text_lines
+
+
+CSV_TEXT = (
+    '09/05/2023 09:00,Leeds,Jerome Soper,"Regular Iced americano - 2.15, Large Hot Chocolate - 1.70",3.85,CARD,7925280230207247\r\n'
+    '\r\n'
+    '09/05/2023 09:01,Leeds,Ronald Moss,"Large Chai latte - 2.60",2.6,CASH,\r\n'
+)
+
+# Happy Test
+
+def test_extract_stream_matches_full_extract_for_any_chunk_size():
+    expected = extract(CSV_TEXT)
+    body = CSV_TEXT.encode('utf-8')
+
+    for chunk_size in (1, 7, 64, len(body)):
+        chunks = (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+        assert list(extract_stream(iter_text_lines(chunks))) == expected
+
+def test_branch_and_payment_method_are_shared_between_rows():
+    first, second = extract(CSV_TEXT + CSV_TEXT)[:2]
+
+    assert first[1] is second[1]
+    assert first[5] == "CARD" and second[5] == "CASH"
+    assert first[5] is extract(CSV_TEXT)[0][5]
+    # PII columns are left as they are
+    assert first[2] == "Jerome Soper"
+
+# Edge Case Test
+
+def test_iter_text_lines_handles_multibyte_characters_split_across_chunks():
+    body = 'Café,Leeds\nlast line without newline'.encode('utf-8')
+    split_at = body.index('é'.encode('utf-8')) + 1  # split inside the 2 byte character
+
+    lines = list(iter_text_lines([body[:split_at], body[split_at:]]))
+
+    assert lines == ['Café,Leeds\n', 'last line without newline']
+
+
+def test_get_files_info_reads_every_record_including_sqs_wrapped_ones():
+    def s3_record(key, **object_fields):
+        return {'s3': {'bucket': {'name': 'cuppa-chaos-raw-data'}, 'object': {'key': key, **object_fields}}}
+
+    event = {'Records': [
+        s3_record('leeds_09-05-2023_09-00-00.csv', eTag='etag-leeds'),
+        {'body': json.dumps({'Records': [s3_record('chesterfield+branch.csv'), s3_record('uppingham.csv')]})},
+    ]}
+
+    assert get_files_info(event) == [
+        ('cuppa-chaos-raw-data', 'leeds_09-05-2023_09-00-00.csv', 'etag-leeds'),
+        ('cuppa-chaos-raw-data', 'chesterfield branch.csv', None),
+        ('cuppa-chaos-raw-data', 'uppingham.csv', None),
+    ]
+
+
+def test_missing_etags_are_fetched_with_the_lazily_set_client():
+    client = MagicMock()
+    client.head_object.return_value = {'ETag': '"abc123"'}
+    s3_utils.set_s3_client(client)
+    try:
+        files = s3_utils.add_missing_etags([S3File('bucket', 'a.csv', None), S3File('bucket', 'b.csv', 'known')])
+    finally:
+        s3_utils.set_s3_client(None)
+
+    assert files == [S3File('bucket', 'a.csv', 'abc123'), S3File('bucket', 'b.csv', 'known')]
+    client.head_object.assert_called_once_with(Bucket='bucket', Key='a.csv')
+
+
+def test_missing_etags_are_fetched_concurrently():
+    # Each HEAD waits for the other one, so this only passes if they are in flight at the same time
+    barrier = threading.Barrier(2, timeout=5)
+
+    def head_object(Bucket, Key):
+        barrier.wait()
+        return {'ETag': f'"{Key}-etag"'}
+
+    client = MagicMock()
+    client.head_object.side_effect = head_object
+    s3_utils.set_s3_client(client)
+    try:
+        files = s3_utils.add_missing_etags([S3File('bucket', 'a.csv', None), S3File('bucket', 'b.csv', None)])
+    finally:
+        s3_utils.set_s3_client(None)
+
+    assert [file.etag for file in files] == ['a.csv-etag', 'b.csv-etag']
@@ -0,0 +1,114 @@
+import json
+
+from utils import metrics_utils
+
+
+class FakeClock:
+
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def make_metrics(emitted, **kwargs):
+    return metrics_utils.PipelineMetrics(emit=emitted.append, clock=FakeClock(0.5), cpu_clock=FakeClock(0.25),
+                                         **kwargs)
+
+# Happy Test
+
+def test_stage_emits_an_emf_document():
+    emitted = []
+    metrics = make_metrics(emitted, properties={"Files": "bucket/branch.csv"})
+
+    with metrics.stage('load_orders', rows_in=3) as stage:
+        stage.rows_out = 3
+
+    document = json.loads(emitted[0])
+    directive = document["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "CuppaChaos/ETL"
+    assert directive["Dimensions"] == [["Stage"]]
+    assert {"Name": "WallTime", "Unit": "Milliseconds"} in directive["Metrics"]
+    assert document["Stage"] == "load_orders"
+    assert document["Files"] == "bucket/branch.csv"
+    assert document["WallTime"] == 500.0
+    assert document["CpuTime"] == 250.0
+    assert document["RowsIn"] == 3 and document["RowsOut"] == 3
+    assert document["ProcessPeakRss"] > 0
+    assert document["RssIncrease"] >= 0
+    # Every metric in the directive has a value in the document
+    assert all(metric["Name"] in document for metric in directive["Metrics"])
+
+
+def test_timed_iter_counts_items_and_records_when_exhausted():
+    emitted = []
+    metrics = make_metrics(emitted)
+
+    rows = metrics.timed_iter('extract', iter([["a"], ["b"]]))
+    assert emitted == []
+    assert list(rows) == [["a"], ["b"]]
+
+    document = json.loads(emitted[0])
+    assert document["Stage"] == "extract"
+    assert document["RowsOut"] == 2
+    # 3 calls to next(), the last one hits StopIteration
+    assert document["WallTime"] == 1500.0
+    assert "RowsIn" not in document
+    # Interleaved with the consumer, so the memory growth isn't this stage's alone
+    assert "RssIncrease" not in document
+
+
+def test_rss_increase_is_the_rise_of_the_process_peak_during_the_stage(monkeypatch):
+    emitted = []
+    metrics = make_metrics(emitted)
+    monkeypatch.setattr(metrics_utils, 'peak_rss_mb', iter([300.0, 340.0, 340.0, 340.0]).__next__)
+
+    with metrics.stage('transform'):
+        pass
+    # Stays under the peak the transform reached: nothing added
+    with metrics.stage('load_orders'):
+        pass
+
+    documents = [json.loads(document) for document in emitted]
+    assert [(d["ProcessPeakRss"], d["RssIncrease"]) for d in documents] == [(340.0, 40.0), (340.0, 0.0)]
+
+
+def test_trace_memory_reports_the_heap_peak():
+    emitted = []
+    metrics = make_metrics(emitted, trace_memory=True)
+
+    with metrics.stage('transform'):
+        payload = [bytes(1024) for _ in range(1024)]
+    del payload
+
+    assert json.loads(emitted[0])["PeakHeap"] >= 1.0
+
+def test_counts_are_emitted_as_count_metrics():
+    emitted = []
+    metrics = make_metrics(emitted)
+
+    metrics.record_counts('prepared_statements', {"PreparedStatementPrepares": 0, "PreparedStatementExecutes": 12})
+
+    document = json.loads(emitted[0])
+    assert document["Stage"] == "prepared_statements"
+    assert document["PreparedStatementExecutes"] == 12
+    assert {"Name": "PreparedStatementPrepares", "Unit": "Count"} in document["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    assert metrics.stages == []
+
+# Unhappy Test
+
+def test_stage_is_recorded_when_it_raises():
+    emitted = []
+    metrics = make_metrics(emitted)
+
+    try:
+        with metrics.stage('load_products', rows_in=1):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert json.loads(emitted[0])["Stage"] == "load_products"
+    assert metrics.summary() == "load_products=500.0ms"
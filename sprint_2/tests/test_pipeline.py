@@ -0,0 +1,81 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+import pipeline
+import transformation
+from cuppa_chaos_etl_lambda import TABLE_COLUMNS
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+
+    def save_data_in_db(connection, cursor, table, data, columns, mode, batch_size, commit):
+        assert commit is False
+        calls.append((table, list(data)))
+
+    monkeypatch.setattr(pipeline.sql_utils, 'save_data_in_db', save_data_in_db)
+    return calls
+
+
+def make_pipeline(chunk_rows):
+    return pipeline.Pipeline(MagicMock(), MagicMock(), TABLE_COLUMNS, reconcile=False, chunk_rows=chunk_rows)
+
+# Happy Test
+
+def test_chunked_pipeline_loads_the_same_tables_as_one_pass(loads, sample_rows):
+    rows = sample_rows
+    expected = transformation.transform_rows(rows)
+
+    result = make_pipeline(chunk_rows=7).run(iter(rows))
+
+    loaded = {table: [] for table in TABLE_COLUMNS}
+    for table, data in loads:
+        loaded[table].extend(data)
+    assert loaded == expected
+    assert result.products == expected["products"]
+    assert result.branches == expected["branches"]
+    assert result.row_counts == {table: len(expected[table]) for table in TABLE_COLUMNS}
+    assert result.chunks == -(-len(rows) // 7)
+
+
+def test_each_chunk_loads_products_and_branches_before_its_orders(loads, sample_rows):
+    make_pipeline(chunk_rows=50).run(sample_rows)
+
+    tables = [table for table, _ in loads]
+    assert tables == ["products", "branches", "orders"] * (len(tables) // 3)
+
+
+def test_stage_metrics_are_recorded_once_per_stage(loads, sample_rows):
+    metrics = MagicMock()
+
+    make_pipeline(chunk_rows=50).run(sample_rows, metrics)
+
+    names = [call.args[0].name for call in metrics.record.call_args_list]
+    assert names == ["fetch_extract", "transform", "load_products", "load_branches", "load_orders"]
+
+# Unhappy Test
+
+def test_extract_failure_is_raised_in_the_caller(loads, sample_rows):
+    def rows():
+        yield from sample_rows[:10]
+        raise RuntimeError("S3 read timed out")
+
+    with pytest.raises(RuntimeError, match="S3 read timed out"):
+        make_pipeline(chunk_rows=4).run(rows())
+    assert threading.active_count() == 1
+
+
+def test_load_failure_stops_the_other_stages(monkeypatch, sample_rows):
+    def save_data_in_db(*args, **kwargs):
+        raise RuntimeError("deadlock detected")
+
+    monkeypatch.setattr(pipeline.sql_utils, 'save_data_in_db', save_data_in_db)
+    # Far more chunks than the queues hold, the workers would block forever if they weren't stopped
+    rows = sample_rows * 20
+
+    with pytest.raises(RuntimeError, match="deadlock detected"):
+        make_pipeline(chunk_rows=5).run(iter(rows))
+    assert threading.active_count() == 1
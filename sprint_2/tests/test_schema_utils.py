@@ -0,0 +1,70 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from utils import schema_utils
+
+
+@pytest.fixture(autouse=True)
+def cold_container():
+    schema_utils._confirmed_version = None
+    yield
+    schema_utils._confirmed_version = None
+
+
+def test_migrations_folder_has_contiguous_versions():
+    versions = [version for version, _, _ in schema_utils.list_migrations()]
+    assert versions == list(range(1, len(versions) + 1))
+
+# Happy Test
+
+def test_ensure_schema_applies_missing_versions_once_per_container():
+    connection, cursor = MagicMock(), MagicMock()
+    cursor.fetchone.return_value = (0,)  # no schema_version table yet
+
+    assert schema_utils.ensure_schema(connection, cursor) == schema_utils.list_migrations()[-1][0]
+    executed_sql = [c.args[0] for c in cursor.execute.call_args_list]
+    assert any("CREATE TABLE IF NOT EXISTS orders" in sql for sql in executed_sql)
+
+    # Warm invocation: no round trips at all
+    cursor.reset_mock()
+    schema_utils.ensure_schema(connection, cursor)
+    cursor.execute.assert_not_called()
+
+
+def test_ensure_schema_skips_ddl_when_database_is_current():
+    connection, cursor = MagicMock(), MagicMock()
+    latest_version = schema_utils.list_migrations()[-1][0]
+    cursor.fetchone.side_effect = [(1,), (latest_version,), (0,)]
+
+    schema_utils.ensure_schema(connection, cursor)
+
+    executed_sql = [c.args[0] for c in cursor.execute.call_args_list]
+    assert not any("CREATE TABLE" in sql for sql in executed_sql)
+
+# Edge Case Test
+
+def test_legacy_tables_are_upgraded_even_when_version_1_is_recorded():
+    connection, cursor = MagicMock(), MagicMock()
+    latest_version = schema_utils.list_migrations()[-1][0]
+    # schema_version exists, latest version recorded, orders still has order_time
+    cursor.fetchone.side_effect = [(1,), (latest_version,), (1,)]
+
+    schema_utils.ensure_schema(connection, cursor)
+
+    executed_sql = [c.args[0] for c in cursor.execute.call_args_list]
+    assert any("RENAME COLUMN order_time TO order_date" in sql for sql in executed_sql)
+    assert not any("CREATE TABLE" in sql for sql in executed_sql)
+
+
+def test_legacy_upgrade_runs_before_v001_on_a_never_migrated_database():
+    connection, cursor = MagicMock(), MagicMock()
+    # no schema_version table, orders has order_time
+    cursor.fetchone.side_effect = [(0,), (1,)]
+
+    schema_utils.ensure_schema(connection, cursor)
+
+    executed_sql = [c.args[0] for c in cursor.execute.call_args_list]
+    upgrade = next(i for i, sql in enumerate(executed_sql) if "RENAME COLUMN order_time" in sql)
+    create = next(i for i, sql in enumerate(executed_sql) if "CREATE TABLE IF NOT EXISTS orders" in sql)
+    assert upgrade < create
@@ -0,0 +1,182 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import MagicMock
+
+import transformation
+from utils import sql_utils
+
+
+PRODUCT_COLUMNS = ["product_id", "name", "size", "flavour", "price"]
+
+S3File = namedtuple('S3File', ['bucket_name', 'key', 'etag'])
+
+
+def make_products(count):
+    return [{"product_id": f"id-{i}", "name": "Latte", "size": "Large", "flavour": None, "price": 2.45}
+            for i in range(count)]
+
+# Happy Test
+
+def test_batched_insert_sends_one_statement_per_batch():
+    connection, cursor = MagicMock(), MagicMock()
+
+    sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(5),
+                              columns=PRODUCT_COLUMNS, mode="batch", batch_size=2)
+
+    # 5 rows in batches of 2 -> 2 full batches and one batch of 1
+    assert cursor.execute.call_count == 3
+    first_sql, first_values = cursor.execute.call_args_list[0].args
+    last_sql, last_values = cursor.execute.call_args_list[2].args
+    assert first_sql.count("(%s, %s, %s, %s, %s)") == 2
+    assert last_sql.count("(%s, %s, %s, %s, %s)") == 1
+    assert first_values == ["id-0", "Latte", "Large", None, 2.45, "id-1", "Latte", "Large", None, 2.45]
+    assert "ON CONFLICT (product_id) DO NOTHING" in first_sql
+    connection.commit.assert_called_once()
+
+def test_staged_load_copies_into_a_temp_table_then_merges():
+    connection, cursor = MagicMock(), MagicMock()
+    data = make_products(2)
+    data[1]["name"] = "Tab\there"
+
+    sql_utils.save_data_in_db(connection, cursor, table="products", data=data,
+                              columns=PRODUCT_COLUMNS, mode="staged")
+
+    copy_sql, buffer = cursor.copy_expert.call_args.args
+    assert copy_sql == "COPY stage_products (product_id, name, size, flavour, price) FROM STDIN"
+    assert buffer.getvalue() == "id-0\tLatte\tLarge\t\\N\t2.45\nid-1\tTab\\there\tLarge\t\\N\t2.45\n"
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert "CREATE TEMP TABLE stage_products (LIKE products" in statements[0]
+    assert "SELECT product_id, name, size, flavour, price FROM stage_products" in statements[1]
+    assert "ON CONFLICT (product_id) DO NOTHING" in statements[1]
+    connection.commit.assert_called_once()
+
+def test_records_are_passed_to_the_driver_as_they_are():
+    connection, cursor = MagicMock(), MagicMock()
+    records = [transformation.ProductRow(f"id-{i}", "Latte", "Large", None, 2.45) for i in range(3)]
+
+    sql_utils.save_data_in_db(connection, cursor, table="products", data=records,
+                              columns=PRODUCT_COLUMNS, mode="row")
+    assert [call.args[1] for call in cursor.execute.call_args_list] == records
+    assert cursor.execute.call_args_list[0].args[1] is records[0]
+
+    cursor.reset_mock()
+    sql_utils.save_data_in_db(connection, cursor, table="products", data=records,
+                              columns=PRODUCT_COLUMNS, mode="batch", batch_size=2)
+    assert cursor.execute.call_args_list[0].args[1] == ["id-0", "Latte", "Large", None, 2.45,
+                                                        "id-1", "Latte", "Large", None, 2.45]
+
+def test_prepared_insert_is_prepared_once_per_connection_then_executed_in_batches():
+    connection, cursor = MagicMock(), MagicMock()
+    cursor.fetchone.return_value = None
+    before = sql_utils.prepared_statement_stats()
+
+    for _ in range(2):
+        sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(5),
+                                  columns=PRODUCT_COLUMNS, mode="prepared", batch_size=2)
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    name = sql_utils.get_prepared_insert_name("products", PRODUCT_COLUMNS)
+    assert "FROM pg_prepared_statements" in statements[0]
+    assert f"PREPARE {name} AS" in statements[1]
+    assert "VALUES ($1, $2, $3, $4, $5)" in statements[1]
+    assert sum("PREPARE" in sql for sql in statements) == 1
+    # 5 rows in batches of 2, twice
+    executes = statements[2:]
+    assert len(executes) == 6
+    assert executes[0].count(f"EXECUTE {name} (%s, %s, %s, %s, %s)") == 2
+    assert executes[2].count("EXECUTE") == 1
+    assert cursor.execute.call_args_list[2].args[1] == ["id-0", "Latte", "Large", None, 2.45,
+                                                        "id-1", "Latte", "Large", None, 2.45]
+
+    after = sql_utils.prepared_statement_stats()
+    assert after["checks"] - before["checks"] == 1
+    assert after["prepares"] - before["prepares"] == 1
+    assert after["executes"] - before["executes"] == 10
+
+
+def test_prepared_statement_already_on_the_server_is_not_prepared_again():
+    connection, cursor = MagicMock(), MagicMock()
+    cursor.fetchone.return_value = (1,)
+
+    sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(1),
+                              columns=PRODUCT_COLUMNS, mode="prepared")
+
+    assert not any("PREPARE" in call.args[0] for call in cursor.execute.call_args_list)
+
+
+def test_prepared_statement_counts_add_up_across_load_threads():
+    before = sql_utils.prepared_statement_stats()
+
+    # One connection per thread, as concurrent_load hands them out
+    def load(_):
+        connection, cursor = MagicMock(), MagicMock()
+        cursor.fetchone.return_value = None
+        for _ in range(50):
+            sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(3),
+                                      columns=PRODUCT_COLUMNS, mode="prepared", batch_size=1)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(load, range(8)))
+
+    after = sql_utils.prepared_statement_stats()
+    assert after["prepares"] - before["prepares"] == 8
+    assert after["executes"] - before["executes"] == 8 * 50 * 3
+
+# Unhappy Test
+
+def test_batched_insert_rolls_back_on_error():
+    connection, cursor = MagicMock(), MagicMock()
+    cursor.execute.side_effect = RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(3),
+                                  columns=PRODUCT_COLUMNS, mode="batch")
+
+    connection.rollback.assert_called_once()
+    connection.commit.assert_not_called()
+
+
+def test_failed_prepared_load_checks_the_server_again_next_time():
+    connection, cursor = MagicMock(), MagicMock()
+    cursor.fetchone.return_value = None
+    sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(1),
+                              columns=PRODUCT_COLUMNS, mode="prepared")
+
+    cursor.execute.side_effect = RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(1),
+                                  columns=PRODUCT_COLUMNS, mode="prepared")
+    connection.rollback.assert_called_once()
+
+    cursor.execute.reset_mock(side_effect=True)
+    sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(1),
+                              columns=PRODUCT_COLUMNS, mode="prepared")
+    assert "FROM pg_prepared_statements" in cursor.execute.call_args_list[0].args[0]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        sql_utils.save_data_in_db(MagicMock(), MagicMock(), table="products", data=make_products(1),
+                                  columns=PRODUCT_COLUMNS, mode="bulk")
+
+
+def test_commit_false_leaves_the_transaction_to_the_caller():
+    connection, cursor = MagicMock(), MagicMock()
+
+    for mode in ("row", "batch", "staged", "prepared"):
+        sql_utils.save_data_in_db(connection, cursor, table="products", data=make_products(3),
+                                  columns=PRODUCT_COLUMNS, mode=mode, commit_every=1, commit=False)
+
+    connection.commit.assert_not_called()
+
+
+def test_get_processed_files_only_matches_the_same_etag():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [("raw-data", "leeds.csv", "etag-1")]
+    already_loaded = S3File("raw-data", "leeds.csv", "etag-1")
+    reuploaded = S3File("raw-data", "leeds.csv", "etag-2")
+
+    assert sql_utils.get_processed_files(cursor, [already_loaded, reuploaded]) == {already_loaded}
+    assert sql_utils.get_processed_files(cursor, []) == set()
@@ -0,0 +1,142 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+import transformation
+
+
+RAW_ROWS = [
+    ["09/05/2023 09:00", "Leeds", "Jerome Soper",
+     "Regular Iced americano - 2.15, Large Hot Chocolate - 1.70, Regular Iced americano - 2.15", "6.0", "CARD", "7925280230207247"],
+    ["09/05/2023 09:01", "Leeds", "Ronald Moss", "Regular Flavoured latte - Hazelnut - 2.55", "2.55", "CASH", ""],
+    ["not a date", "Chesterfield", "Joseph Mccabe", "Large Chai latte - 2.60", "2.6", "CARD", "6840608068100313"],
+    ["09/05/2023 09:03", "Leeds"],  # malformed, too short
+]
+
+
+def empty_cursor():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = []
+    return cursor
+
+# Happy Test
+
+def test_parse_product_item_splits_size_name_flavour_and_price():
+    assert transformation.parse_product_item("Large Chai latte - 2.60") == ("Large", "Chai Latte", None, 2.60)
+    assert transformation.parse_product_item("Regular Flavoured latte - Hazelnut - 2.55") == \
+        ("Regular", "Flavoured Latte", "Hazelnut", 2.55)
+    assert transformation.parse_product_item("Speciality Tea - Peppermint - 1.30") == \
+        (None, "Speciality Tea", "Peppermint", 1.30)
+
+
+def test_transform_rows_builds_products_branches_and_orders_in_one_pass():
+    result = transformation.transform_rows(RAW_ROWS, empty_cursor())
+
+    assert [(p.name, p.size, p.flavour, p.price) for p in result["products"]] == [
+        ("Iced Americano", "Regular", None, 2.15),
+        ("Hot Chocolate", "Large", None, 1.70),
+        ("Flavoured Latte", "Regular", "Hazelnut", 2.55),
+        ("Chai Latte", "Large", None, 2.60),
+    ]
+    assert [b.branch_name for b in result["branches"]] == ["Leeds", "Chesterfield"]
+
+    # The row with an unparseable date still contributes its product and branch, but no order
+    orders = result["orders"]
+    assert len(orders) == 3
+    americano = orders[0]
+    assert americano.quantity == 2
+    assert americano.total_price == 2.15 * 2
+    assert americano.order_date == datetime(2023, 5, 9, 9, 0)
+    assert americano.product_id == result["products"][0].product_id
+    assert americano.branch_id == result["branches"][0].branch_id
+    assert orders[0].order_id == orders[1].order_id != orders[2].order_id
+    assert "Jerome Soper" not in str(result)
+
+# Edge Case Test
+
+def test_transform_rows_reuses_ids_already_in_the_database():
+    cursor = MagicMock()
+    cursor.fetchall.side_effect = [
+        [("existing-product", "Chai Latte", "Large", None)],
+        [("existing-branch", "Chesterfield")],
+    ]
+    row = ["09/05/2023 09:05"] + RAW_ROWS[2][1:]
+
+    result = transformation.transform_rows([row], cursor)
+
+    # Nothing new to insert, and the order points at the ids already in the DB
+    assert result["products"] == []
+    assert result["branches"] == []
+    assert result["orders"][0].product_id == "existing-product"
+    assert result["orders"][0].branch_id == "existing-branch"
+
+
+def test_parse_product_item_is_cached_on_the_raw_item_string():
+    transformation.parse_product_item.cache_clear()
+
+    for _ in range(3):
+        transformation.parse_product_item(" Large Hot Chocolate - 1.70")
+
+    stats = transformation.product_parse_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert stats["size"] == 1
+
+
+def test_parse_order_datetime_matches_strptime_and_rejects_bad_dates():
+    assert transformation.parse_order_datetime("09/05/2023 09:00") == datetime(2023, 5, 9, 9, 0)
+    # Not zero padded, so it takes the strptime fallback
+    assert transformation.parse_order_datetime("9/5/2023 9:00") == datetime(2023, 5, 9, 9, 0)
+
+    for bad in ("31/02/2023 10:00", "ab/05/2023 09:00", ""):
+        with pytest.raises(ValueError):
+            transformation.parse_order_datetime(bad)
+
+
+
+def test_warm_invocation_skips_the_table_scans_and_only_looks_up_unseen_keys():
+    first = transformation.transform_rows(RAW_ROWS[:2], empty_cursor())
+    transformation.remember_loaded(first)
+
+    cursor = MagicMock()
+    cursor.fetchone.return_value = None
+    second = transformation.transform_rows(RAW_ROWS[:3], cursor)
+
+    executed_sql = [c.args[0] for c in cursor.execute.call_args_list]
+    assert not any("SELECT product_id, name, size, flavour FROM products" in sql for sql in executed_sql)
+    assert not any("SELECT branch_id, branch_name FROM branches" in sql for sql in executed_sql)
+    # Only the new branch and the new product were looked up
+    assert len(executed_sql) == 2
+    assert [b.branch_name for b in second["branches"]] == ["Chesterfield"]
+    assert [p.name for p in second["products"]] == ["Chai Latte"]
+    assert second["orders"][0].product_id == first["orders"][0].product_id
+
+
+
+def test_ids_are_derived_from_content_so_a_rerun_gives_the_same_rows():
+    duplicate_row = list(RAW_ROWS[1])
+    rows = RAW_ROWS + [duplicate_row]
+
+    first = transformation.transform_rows(rows)
+    second = transformation.transform_rows(rows)
+
+    assert first == second
+    assert first["products"][0].product_id == transformation.product_uuid(("Iced Americano", "Regular", None))
+    assert first["branches"][0].branch_id == transformation.branch_uuid("Leeds")
+    # Two identical rows in one file are still two orders
+    order_ids = [o.order_id for o in first["orders"]]
+    assert order_ids[2] != order_ids[3]
+    assert len(set(order_ids)) == 3
+
+
+def test_a_file_batched_with_its_own_copy_gets_the_same_order_ids_as_alone(sample_rows):
+    leeds = [row for row in sample_rows if row[1] == "Leeds"]
+    alone = transformation.transform_rows(transformation.rows_by_source([("leeds.csv", leeds)]))
+    # e.g. re-dropped under a new key and delivered in the same SQS batch as the first copy
+    batched = transformation.transform_rows(transformation.rows_by_source(
+        [("leeds.csv", leeds), ("leeds_2.csv", [list(row) for row in leeds])]))
+
+    order_lines = {(o.order_id, o.product_id) for o in alone["orders"]}
+    assert {(o.order_id, o.product_id) for o in batched["orders"]} == order_lines
+    assert len(batched["orders"]) == 2 * len(alone["orders"])